@@ -1,5 +1,6 @@
 import os
 import logging
+import tempfile
 
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
@@ -7,6 +8,8 @@ from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
+from cache import FileCache
+
 logging.basicConfig(level=logging.DEBUG)
 
 
@@ -16,6 +19,7 @@ class Base(DeclarativeBase):
 
 db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
+cache = FileCache()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
@@ -27,13 +31,31 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_recycle": 300,
     "pool_pre_ping": True,
 }
+app.config["DASHBOARD_CACHE_TTL"] = int(os.environ.get("DASHBOARD_CACHE_TTL", 15))
+app.config["CACHE_DIR"] = os.environ.get(
+    "CACHE_DIR", os.path.join(tempfile.gettempdir(), "inventory-cache"))
+app.config["UPLOAD_DIR"] = os.environ.get(
+    "UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "inventory-uploads"))
+app.config["IMPORT_WORKERS"] = int(os.environ.get("IMPORT_WORKERS", 1))
+# Opt-in COPY import path on PostgreSQL; multi-row INSERTs otherwise.
+app.config["IMPORT_COPY"] = os.environ.get("IMPORT_COPY", "0") == "1"
+# Batch stock commits across request threads; only useful with gthread workers.
+app.config["GROUP_COMMIT"] = os.environ.get("GROUP_COMMIT", "0") == "1"
+app.config["GROUP_COMMIT_WINDOW_MS"] = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", 2))
+app.config["GROUP_COMMIT_MAX_BATCH"] = int(os.environ.get("GROUP_COMMIT_MAX_BATCH", 64))
+# '' picks the database's own search index; 'ngram' uses an in-process index.
+app.config["SEARCH_BACKEND"] = os.environ.get("SEARCH_BACKEND", "")
+# Hydrate current_user from a principal in the signed session cookie.
+app.config["SESSION_PRINCIPAL"] = os.environ.get("SESSION_PRINCIPAL", "0") == "1"
 
 db.init_app(app)
 login_manager.init_app(app)
+cache.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message = 'Please log in to access this page.'
 login_manager.login_message_category = 'info'
 
 with app.app_context():
     import models
+    import search
     db.create_all()
@@ -0,0 +1,89 @@
+"""Measure stock-sale throughput with and without GROUP_COMMIT.
+
+Runs concurrent sales of one product through the /products/<id>/stock
+route, first with the default one-commit-per-request path and then with
+the group committer, against a throwaway database:
+
+    python bench_group_commit.py --threads 4 --sales 100
+    DATABASE_URL=postgresql://... python bench_group_commit.py
+
+Without DATABASE_URL a temporary SQLite file is used.  Sales that fail
+(e.g. 'database is locked' on SQLite) are counted, not retried.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix='bench-group-commit-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('SESSION_SECRET', 'bench')
+os.environ.setdefault('CACHE_DIR', os.path.join(_tmpdir, 'cache'))
+
+import logging
+
+import main  # noqa: F401  (registers the routes)
+from app import app, db
+from models import Product, Transaction
+
+
+def seed_product(stock):
+    with app.app_context():
+        product = Product(name='Benchmark item', sku=f'BENCH-{time.time_ns()}', quantity=stock)
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+
+def run(product_id, threads, sales, group_commit):
+    app.config['GROUP_COMMIT'] = group_commit
+    failures = []
+
+    def worker():
+        client = app.test_client()
+        client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+        for _ in range(sales):
+            try:
+                response = client.post(f'/products/{product_id}/stock',
+                                       data={'action': 'sale', 'quantity': '1'})
+                if response.status_code != 302:
+                    failures.append(response.status_code)
+            except Exception as e:
+                failures.append(e)
+
+    with app.app_context():
+        before = Transaction.query.filter_by(product_id=product_id).count()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+    with app.app_context():
+        recorded = Transaction.query.filter_by(product_id=product_id).count() - before
+    return recorded, len(failures), elapsed
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--sales', type=int, default=100, help='sales per thread')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    app.config['TESTING'] = True
+    print(f"{app.config['SQLALCHEMY_DATABASE_URI']}, {args.threads} threads x {args.sales} sales, "
+          f"window {app.config['GROUP_COMMIT_WINDOW_MS']} ms, "
+          f"max batch {app.config['GROUP_COMMIT_MAX_BATCH']}")
+    for group_commit in (False, True):
+        product_id = seed_product(args.threads * args.sales)
+        recorded, failed, elapsed = run(product_id, args.threads, args.sales, group_commit)
+        print(f"{'group commit' if group_commit else 'per request':>12}: "
+              f"{recorded / elapsed:8.1f} sales/s  ({recorded} recorded, {failed} failed, "
+              f"{elapsed:.2f}s)")
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,86 @@
+"""Measure CSV product import throughput: multi-row INSERT vs. COPY.
+
+Imports the same generated CSV with the default importer and, on
+PostgreSQL, with the COPY importer that IMPORT_COPY=1 selects, each into
+fresh SKUs:
+
+    DATABASE_URL=postgresql+psycopg2://... python bench_import.py --rows 100000
+    python bench_import.py --rows 20000
+
+Without DATABASE_URL a temporary SQLite file is used and only the INSERT
+path runs.  Imported rows are deleted afterwards unless --keep is given.
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix='bench-import-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ.setdefault('SESSION_SECRET', 'bench')
+os.environ.setdefault('CACHE_DIR', os.path.join(_tmpdir, 'cache'))
+
+import logging
+
+import main  # noqa: F401  (registers the models and event hooks)
+from app import app, db
+from importer import ProductImporter, PostgresProductImporter, read_csv_upload
+from models import Product
+
+
+def make_csv(prefix, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['SKU', 'Name', 'Description', 'Purchase Price', 'Selling Price',
+                     'Quantity', 'Reorder Level', 'Category', 'Supplier'])
+    for i in range(rows):
+        writer.writerow([f'{prefix}-{i:07d}', f'Bench item {i}', f'Generated row {i}\tfor {prefix}',
+                         '1.25', '2.50', i % 100, 10, f'Bench category {i % 20}',
+                         f'Bench supplier {i % 10}'])
+    return buffer.getvalue().encode('utf-8')
+
+
+def run(importer_class, data):
+    with app.app_context():
+        started = time.perf_counter()
+        importer = importer_class(db.session)
+        importer.feed_all(read_csv_upload(io.BytesIO(data)))
+        db.session.commit()
+        return importer.imported, time.perf_counter() - started
+
+
+def cleanup(prefix):
+    with app.app_context():
+        Product.query.filter(Product.sku.startswith(f'{prefix}-')).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--keep', action='store_true', help='keep the imported products')
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    print(f"{app.config['SQLALCHEMY_DATABASE_URI']}, {args.rows} rows")
+
+    importers = [('insert', ProductImporter)]
+    if dialect == 'postgresql':
+        importers.append(('copy', PostgresProductImporter))
+    else:
+        print('        copy: skipped (needs PostgreSQL)')
+    for label, importer_class in importers:
+        prefix = f'BENCH{time.time_ns()}'
+        imported, elapsed = run(importer_class, make_csv(prefix, args.rows))
+        print(f'{label:>12}: {imported / elapsed:10.1f} rows/s  ({imported} imported, '
+              f'{elapsed:.2f}s)')
+        if not args.keep:
+            cleanup(prefix)
+
+
+if __name__ == '__main__':
+    cli()
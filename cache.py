@@ -0,0 +1,144 @@
+import fcntl
+import json
+import os
+import stat
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timezone
+
+
+def ensure_private_directory(path):
+    """Create ``path`` for this process alone, or check that an existing
+    directory is.  The defaults live under the shared temp directory, where
+    another local user could have created them first."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid() or st.st_mode & 0o077:
+        raise RuntimeError(f'{path} must be a directory owned by this user with mode 0700')
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f'{type(value).__name__} is not cacheable')
+
+
+def _decode(obj):
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+def _split_stamp(stamp):
+    epoch, _, count = stamp.rpartition('.')
+    if not epoch or not count.isdigit():
+        return None, 0
+    return epoch, int(count)
+
+
+def is_next_stamp(stamp, previous):
+    """Whether ``stamp`` is the bump that directly followed ``previous``."""
+    epoch, count = _split_stamp(stamp)
+    if epoch is None:
+        return False
+    if count == 1:
+        # The first bump of a new epoch replaced a missing stamp.
+        return _split_stamp(previous)[0] is None
+    return (epoch, count - 1) == _split_stamp(previous)
+
+
+class FileCache:
+    """A small TTL cache stored as files in a directory on local disk.
+
+    Every gunicorn worker on the host reads and writes the same directory,
+    so a value computed by one worker is served by all of them until it
+    expires.  Values are stored as JSON, so they must be plain data; dates
+    and datetimes round-trip, tuples come back as lists.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.setdefault(
+            'CACHE_DIR', os.path.join(tempfile.gettempdir(), 'inventory-cache'))
+        ensure_private_directory(self.directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace('/', '_') + '.json')
+
+    def get(self, key, max_age):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > max_age:
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f, object_hook=_decode)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, default=_encode)
+            os.replace(tmp_path, self._path(key))
+        except (OSError, TypeError, ValueError):
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def version(self, name):
+        """Return the current version stamp for ``name`` ('0' if never bumped)."""
+        try:
+            with open(os.path.join(self.directory, f'version-{name}'), 'r') as f:
+                return f.read().strip() or '0'
+        except OSError:
+            return '0'
+
+    def bump(self, name):
+        """Give ``name`` a new version stamp, visible to every worker, and
+        return it.
+
+        Stamps are ``<epoch>.<count>``.  The count goes up by exactly one
+        per bump across all workers (see ``is_next_stamp``); a missing
+        stamp starts a new random epoch, so a wiped directory never repeats
+        a stamp handed out before.
+        """
+        with open(os.path.join(self.directory, f'version-{name}.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            epoch, count = _split_stamp(self.version(name))
+            stamp = f'{epoch or uuid.uuid4().hex}.{count + 1}'
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(stamp)
+            os.replace(tmp_path, os.path.join(self.directory, f'version-{name}'))
+        return stamp
+
+    def version_time(self, name):
+        """When ``name`` was last bumped (UTC), or None if it never was."""
+        try:
+            return datetime.fromtimestamp(
+                os.path.getmtime(os.path.join(self.directory, f'version-{name}')), timezone.utc)
+        except OSError:
+            return None
+
+    def get_or_set(self, key, max_age, loader):
+        value = self.get(key, max_age)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
@@ -0,0 +1,337 @@
+import csv
+import io
+from datetime import datetime
+
+from sqlalchemy import bindparam, insert, select, text, update
+
+from models import Product, Category, Supplier
+from ngram import VERSION_NAME as SEARCH_VERSION
+from rollups import upsert_insert
+from versions import touch
+
+
+IMPORT_CHUNK_SIZE = 1000
+# COPY amortises its fixed cost over more rows, so PostgreSQL uses larger chunks.
+COPY_CHUNK_SIZE = 10000
+IMPORT_MODES = ('insert', 'upsert')
+# Columns an upsert import may overwrite on existing products.  Quantity is
+# deliberately absent: stock only changes through the transaction ledger.
+UPDATABLE_COLUMNS = ('name', 'description', 'purchase_price', 'selling_price',
+                     'reorder_level', 'category_id', 'supplier_id')
+DEFAULT_UPDATE_COLUMNS = ('purchase_price', 'selling_price')
+# Bytes read from the upload per decode step.
+UPLOAD_READ_SIZE = 64 * 1024
+# Per-row error messages kept for reporting; the count is always exact.
+MAX_REPORTED_ERRORS = 1000
+
+
+def read_csv_upload(stream, encoding='utf-8'):
+    """Iterate the rows of an uploaded CSV as dicts without reading it all.
+
+    The binary stream is decoded incrementally, ``UPLOAD_READ_SIZE`` bytes
+    at a time, so memory use does not depend on the size of the file.
+    """
+    text = io.TextIOWrapper(io.BufferedReader(stream, UPLOAD_READ_SIZE),
+                            encoding=encoding, newline='')
+    try:
+        yield from csv.DictReader(text)
+    finally:
+        # Detach both wrappers so the caller's stream is left open.
+        text.detach().detach()
+
+
+def _field(row, title, name, default=''):
+    return row.get(title, row.get(name, default))
+
+
+def parse_product_row(row):
+    """Turn one CSV row into Product column values.
+
+    Returns None for rows without a SKU or name, which are skipped silently;
+    raises ValueError/AttributeError for malformed values.
+    """
+    sku = _field(row, 'SKU', 'sku').strip()
+    if not sku:
+        return None
+    name = _field(row, 'Name', 'name').strip()
+    if not name:
+        return None
+    quantity = int(_field(row, 'Quantity', 'quantity', 0) or 0)
+    if quantity < 0:
+        raise ValueError(f"Quantity for SKU '{sku}' cannot be negative")
+    return {
+        'name': name,
+        'sku': sku,
+        'description': _field(row, 'Description', 'description'),
+        'purchase_price': float(_field(row, 'Purchase Price', 'purchase_price', 0) or 0),
+        'selling_price': float(_field(row, 'Selling Price', 'selling_price', 0) or 0),
+        'quantity': quantity,
+        'reorder_level': int(_field(row, 'Reorder Level', 'reorder_level', 10) or 10),
+        'category_name': _field(row, 'Category', 'category').strip(),
+        'supplier_name': _field(row, 'Supplier', 'supplier').strip(),
+    }
+
+
+class ProductImporter:
+    """Set-based CSV product import.
+
+    Rows are buffered and written ``chunk_size`` at a time: one SKU lookup
+    per chunk, one multi-row INSERT each for any new categories and
+    suppliers, and one multi-row INSERT for the products.  In ``upsert``
+    mode existing SKUs have ``update_columns`` overwritten through the
+    dialect's ``INSERT ... ON CONFLICT (sku) DO UPDATE`` (an UPDATE then an
+    INSERT where there is none) instead of being skipped.  Category and
+    supplier name maps are loaded once up front.  Nothing is committed;
+    the caller owns the transaction, and may use ``after_chunk`` to commit
+    or report progress after each chunk is written.
+    """
+
+    def __init__(self, session, chunk_size=IMPORT_CHUNK_SIZE, after_chunk=None,
+                 mode='insert', update_columns=DEFAULT_UPDATE_COLUMNS):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f'Unknown import mode: {mode}')
+        if mode == 'upsert' and not set(update_columns) <= set(UPDATABLE_COLUMNS):
+            raise ValueError('Unsupported update columns: '
+                             + ', '.join(sorted(set(update_columns) - set(UPDATABLE_COLUMNS))))
+        self.session = session
+        self.chunk_size = chunk_size
+        self.after_chunk = after_chunk
+        self.mode = mode
+        self.update_columns = tuple(update_columns)
+        self.imported = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+        self.rows_read = 0
+        self._pending = []
+        self._categories = self._load_names(Category)
+        self._suppliers = self._load_names(Supplier)
+
+    def _load_names(self, model):
+        names = {}
+        for id_, name in self.session.execute(select(model.id, model.name).order_by(model.id)):
+            names.setdefault(name, id_)
+        return names
+
+    def feed(self, row):
+        self.rows_read += 1
+        try:
+            values = parse_product_row(row)
+        except Exception as e:
+            self.skipped += 1
+            self.add_error(str(e))
+            return
+        if values is None:
+            self.skipped += 1
+            return
+        self._pending.append(values)
+        if len(self._pending) >= self.chunk_size:
+            self.flush()
+
+    def add_error(self, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def feed_all(self, rows):
+        for row in rows:
+            self.feed(row)
+        self.flush()
+        return self
+
+    def flush(self):
+        if not self._pending:
+            return
+        chunk, self._pending = self._pending, []
+
+        skus = {values['sku'] for values in chunk}
+        existing = set(self.session.scalars(select(Product.sku).where(Product.sku.in_(skus))))
+
+        if self.mode == 'upsert':
+            products = self._latest_per_sku(chunk)
+        else:
+            products = []
+            for values in chunk:
+                if values['sku'] in existing:
+                    self.skipped += 1
+                    self.add_error(f"SKU '{values['sku']}' already exists")
+                    continue
+                existing.add(values['sku'])
+                products.append(values)
+
+        self._create_missing(Category, self._categories,
+                             {v['category_name'] for v in products if v['category_name']})
+        self._create_missing(Supplier, self._suppliers,
+                             {v['supplier_name'] for v in products if v['supplier_name']})
+
+        rows = []
+        for values in products:
+            category_name = values.pop('category_name')
+            supplier_name = values.pop('supplier_name')
+            values['category_id'] = self._categories.get(category_name) if category_name else None
+            values['supplier_id'] = self._suppliers.get(supplier_name) if supplier_name else None
+            rows.append(values)
+
+        if self.mode == 'upsert':
+            self.upsert_products(rows)
+            updated = sum(1 for values in rows if values['sku'] in existing)
+            self.updated += updated
+            self.imported += len(rows) - updated
+        else:
+            inserted = self.insert_products(rows)
+            self.imported += inserted
+            self.skipped += len(rows) - inserted
+        if rows:
+            touch(self.session, 'products', SEARCH_VERSION)
+        if self.after_chunk is not None:
+            self.after_chunk(self)
+
+    def _latest_per_sku(self, chunk):
+        # One statement cannot update the same row twice, so when a SKU
+        # repeats within a chunk the last row wins.
+        latest = {}
+        for values in chunk:
+            if values['sku'] in latest:
+                self.skipped += 1
+                self.add_error(f"SKU '{values['sku']}' appears more than once; using the last row")
+            latest[values['sku']] = values
+        return list(latest.values())
+
+    def insert_products(self, rows):
+        """Write new product rows and return how many were inserted."""
+        if rows:
+            self.session.execute(insert(Product), rows)
+        return len(rows)
+
+    def upsert_products(self, rows):
+        """Insert new SKUs and overwrite ``update_columns`` on existing ones."""
+        if not rows:
+            return
+        dialect_insert = upsert_insert(self.session.get_bind().dialect.name)
+        if dialect_insert is None:
+            self._update_then_insert(rows)
+            return
+        stmt = dialect_insert(Product)
+        set_ = {column: stmt.excluded[column] for column in self.update_columns}
+        set_['updated_at'] = datetime.utcnow()
+        self.session.execute(stmt.on_conflict_do_update(index_elements=['sku'], set_=set_), rows)
+
+    def _update_then_insert(self, rows):
+        # Without ON CONFLICT: one executemany UPDATE for the SKUs that
+        # exist, then one multi-row INSERT for the rest.
+        table = Product.__table__
+        existing = set(self.session.scalars(
+            select(Product.sku).where(Product.sku.in_([values['sku'] for values in rows]))))
+        updates = [{'match_sku': values['sku'], **{c: values[c] for c in self.update_columns}}
+                   for values in rows if values['sku'] in existing]
+        if updates:
+            self.session.execute(
+                update(table).where(table.c.sku == bindparam('match_sku')).values(
+                    updated_at=datetime.utcnow(),
+                    **{column: bindparam(column) for column in self.update_columns}),
+                updates)
+        new_rows = [values for values in rows if values['sku'] not in existing]
+        if new_rows:
+            self.session.execute(insert(Product), new_rows)
+
+    def _create_missing(self, model, names, wanted):
+        missing = sorted(wanted - names.keys())
+        if not missing:
+            return
+        self.session.execute(insert(model), [{'name': name} for name in missing])
+        touch(self.session, model.__tablename__)
+        for id_, name in self.session.execute(
+                select(model.id, model.name).where(model.name.in_(missing)).order_by(model.id)):
+            names.setdefault(name, id_)
+
+
+def _copy_value(value):
+    """Format a value for COPY's text format (tab separated, \\N for NULL)."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime):
+        value = value.isoformat(' ')
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class PostgresProductImporter(ProductImporter):
+    """Product import that streams each chunk through ``COPY ... FROM STDIN``
+    into a temporary staging table and merges it into ``products`` with a
+    single INSERT ... SELECT.  Rows whose SKU was inserted concurrently are
+    counted as skipped by the ``ON CONFLICT`` clause."""
+
+    STAGING_TABLE = 'product_import_staging'
+    COLUMNS = ('name', 'sku', 'description', 'purchase_price', 'selling_price', 'quantity',
+               'reorder_level', 'category_id', 'supplier_id', 'created_at', 'updated_at')
+
+    def __init__(self, session, chunk_size=COPY_CHUNK_SIZE, **kwargs):
+        super().__init__(session, chunk_size=chunk_size, **kwargs)
+
+    def _create_staging(self):
+        # ON COMMIT DROP keeps it scoped to the current transaction, which
+        # may be a single chunk when the caller commits per chunk.
+        self.session.execute(text(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {self.STAGING_TABLE} (
+                name VARCHAR(200) NOT NULL,
+                sku VARCHAR(50) NOT NULL,
+                description TEXT,
+                purchase_price DOUBLE PRECISION,
+                selling_price DOUBLE PRECISION,
+                quantity INTEGER,
+                reorder_level INTEGER,
+                category_id INTEGER,
+                supplier_id INTEGER,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP
+            ) ON COMMIT DROP"""))
+
+    def _copy_rows(self, rows):
+        now = _copy_value(datetime.utcnow())
+        buffer = io.StringIO()
+        for row in rows:
+            values = [_copy_value(row[c]) for c in self.COLUMNS[:-2]] + [now, now]
+            buffer.write('\t'.join(values) + '\n')
+        buffer.seek(0)
+
+        dbapi_connection = self.session.connection().connection.dbapi_connection
+        with dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {self.STAGING_TABLE} ({', '.join(self.COLUMNS)}) FROM STDIN", buffer)
+
+    def merge_statement(self):
+        columns = ', '.join(self.COLUMNS)
+        if self.mode == 'upsert':
+            assignments = ', '.join(f'{c} = EXCLUDED.{c}' for c in self.update_columns + ('updated_at',))
+            conflict = f'DO UPDATE SET {assignments}'
+        else:
+            conflict = 'DO NOTHING'
+        return text(f"""
+            INSERT INTO products ({columns})
+            SELECT {columns} FROM {self.STAGING_TABLE}
+            ON CONFLICT (sku) {conflict}""")
+
+    def _merge(self, rows):
+        self._create_staging()
+        self._copy_rows(rows)
+        count = self.session.execute(self.merge_statement()).rowcount
+        self.session.execute(text(f'TRUNCATE {self.STAGING_TABLE}'))
+        return count
+
+    def insert_products(self, rows):
+        if not rows:
+            return 0
+        return self._merge(rows)
+
+    def upsert_products(self, rows):
+        if rows:
+            self._merge(rows)
+
+
+def make_product_importer(session, use_copy=False, **kwargs):
+    """Pick the importer: batched multi-row INSERTs by default, or COPY on
+    PostgreSQL when ``use_copy`` is set (the ``IMPORT_COPY`` setting)."""
+    if use_copy and session.get_bind().dialect.name == 'postgresql':
+        return PostgresProductImporter(session, **kwargs)
+    return ProductImporter(session, **kwargs)
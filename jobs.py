@@ -0,0 +1,109 @@
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from sqlalchemy import update
+
+from app import app, db
+from cache import ensure_private_directory
+from models import ImportJob
+from importer import make_product_importer, read_csv_upload
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config['IMPORT_WORKERS'],
+                                       thread_name_prefix='import-job')
+    return _executor
+
+
+def enqueue_import(file, user_id, mode='insert', update_columns=()):
+    """Save an uploaded CSV to disk, record a queued job and hand it to the
+    background pool.  Returns the new ImportJob."""
+    upload_dir = app.config['UPLOAD_DIR']
+    ensure_private_directory(upload_dir)
+    path = os.path.join(upload_dir, f'{uuid.uuid4().hex}.csv')
+    file.save(path)
+
+    job = ImportJob(user_id=user_id, filename=file.filename, path=path, mode=mode,
+                    update_columns=','.join(update_columns),
+                    bytes_total=os.path.getsize(path))
+    db.session.add(job)
+    db.session.commit()
+
+    if app.config['IMPORT_WORKERS'] > 0:
+        _get_executor().submit(run_import_job, job.id)
+    return job
+
+
+def _claim(job_id):
+    # Only one worker may move a job out of 'queued', whichever process
+    # or thread gets there first.
+    result = db.session.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job_id, ImportJob.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow()))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _save_progress(job, importer, raw):
+    job.bytes_processed = min(raw.tell(), job.bytes_total or 0)
+    job.rows_processed = importer.rows_read
+    job.imported = importer.imported
+    job.updated = importer.updated
+    job.skipped = importer.skipped
+    job.error_count = importer.error_count
+    job.errors = json.dumps(importer.errors)
+
+
+def run_import_job(job_id):
+    """Process one queued import, committing after every chunk so pollers
+    can follow its progress.  Chunks written before a failure are kept."""
+    with app.app_context():
+        if not _claim(job_id):
+            return
+        job = db.session.get(ImportJob, job_id)
+        try:
+            with open(job.path, 'rb') as raw:
+                def checkpoint(importer):
+                    _save_progress(job, importer, raw)
+                    db.session.commit()
+
+                importer = make_product_importer(
+                    db.session, use_copy=app.config['IMPORT_COPY'],
+                    after_chunk=checkpoint, mode=job.mode,
+                    update_columns=job.update_columns.split(',') if job.update_columns else ())
+                importer.feed_all(read_csv_upload(raw))
+                _save_progress(job, importer, raw)
+            job.status = 'completed'
+        except Exception as e:
+            app.logger.exception('Import job %s failed', job_id)
+            db.session.rollback()
+            job = db.session.get(ImportJob, job_id)
+            job.status = 'failed'
+            job.message = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+        try:
+            os.unlink(job.path)
+        except OSError:
+            pass
+
+
+@app.cli.command('run-import-jobs')
+def run_import_jobs_command():
+    """Process every queued import job in this process."""
+    job_ids = db.session.scalars(
+        db.select(ImportJob.id).where(ImportJob.status == 'queued').order_by(ImportJob.id)).all()
+    for job_id in job_ids:
+        run_import_job(job_id)
+        click.echo(f'Processed import job {job_id}.')
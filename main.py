@@ -3,6 +3,7 @@ load_dotenv()
 
 from app import app
 import routes
+import migrations
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,176 @@
+from datetime import datetime
+
+import click
+from sqlalchemy import insert, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from app import app, db, cache
+from models import Product, Supplier, Transaction, SchemaMigration, PRODUCT_SORT_NULLS
+from rollups import replace_movements
+from search import backend_for
+
+
+# Ordered schema changes for databases created before the current models.
+# ``db.create_all()`` only adds missing tables, so anything that alters an
+# existing table (indexes, constraints, backfills) goes here and is applied
+# with ``flask --app main migrate``.  Every step is idempotent, which lets a
+# fresh database created by ``create_all`` run them all as no-ops.
+MIGRATIONS = []
+
+
+def migration(version, name, online=False):
+    """Register a migration step.  ``online`` steps run outside a
+    transaction so PostgreSQL can build indexes CONCURRENTLY.  A step may
+    return the names of version stamps to bump once it has committed."""
+    def register(fn):
+        MIGRATIONS.append((version, name, online, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def create_index(connection, index):
+    """Create ``index`` if it is missing, without blocking writes on
+    PostgreSQL.  A failed CONCURRENTLY build leaves an INVALID index behind,
+    which is dropped and rebuilt rather than skipped by IF NOT EXISTS."""
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect))
+    if connection.dialect.name == 'postgresql':
+        invalid = connection.execute(text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid"""), {'name': index.name}).first()
+        if invalid:
+            connection.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {index.name}')
+        ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+    connection.exec_driver_sql(ddl)
+
+
+def drop_index(connection, name):
+    concurrently = ' CONCURRENTLY' if connection.dialect.name == 'postgresql' else ''
+    connection.exec_driver_sql(f'DROP INDEX{concurrently} IF EXISTS {name}')
+
+
+@migration(1, 'products quantity check constraint')
+def add_quantity_check(connection):
+    if connection.dialect.name != 'postgresql':
+        # SQLite cannot add a constraint to an existing table; new
+        # databases get it from the model.
+        return
+    exists = connection.execute(text(
+        "SELECT 1 FROM pg_constraint WHERE conname = 'ck_products_quantity_non_negative'")).first()
+    if not exists:
+        # NOT VALID takes only a brief lock; existing rows are checked by
+        # VALIDATE, which does not block reads or writes.
+        connection.exec_driver_sql(
+            'ALTER TABLE products ADD CONSTRAINT ck_products_quantity_non_negative '
+            'CHECK (quantity >= 0) NOT VALID')
+        connection.exec_driver_sql(
+            'ALTER TABLE products VALIDATE CONSTRAINT ck_products_quantity_non_negative')
+
+
+@migration(2, 'backfill daily stock movements')
+def backfill_daily_movements(connection):
+    # Always a full rebuild: live stock movements may already have added
+    # rows to the new table before this step runs.
+    replace_movements(connection)
+    return ('transactions',)
+
+
+@migration(3, 'hot query path indexes', online=True)
+def add_query_indexes(connection):
+    for model in (Product, Supplier, Transaction):
+        for index in sorted(model.__table__.indexes, key=lambda i: i.name):
+            create_index(connection, index)
+
+
+@migration(4, 'low stock partial index', online=True)
+def add_low_stock_index(connection):
+    create_index(connection, next(i for i in Product.__table__.indexes
+                                  if i.name == 'ix_products_low_stock'))
+
+
+@migration(5, 'product search index', online=True)
+def install_product_search(connection):
+    backend_for(connection.dialect.name).install(connection, online=True)
+
+
+@migration(6, 'users session version')
+def add_session_version(connection):
+    if 'session_version' not in {c['name'] for c in inspect(connection).get_columns('users')}:
+        connection.exec_driver_sql(
+            'ALTER TABLE users ADD COLUMN session_version INTEGER NOT NULL DEFAULT 1')
+
+
+@migration(7, 'NULL-safe product sort indexes', online=True)
+def add_product_sort_indexes(connection):
+    # The list sorts on coalesce(column, sentinel) so products with a NULL
+    # quantity, price or creation time are paged; the plain column indexes
+    # no longer match those queries.
+    for name in PRODUCT_SORT_NULLS:
+        create_index(connection, next(i for i in Product.__table__.indexes
+                                      if i.name == f'ix_products_{name}_sort'))
+        drop_index(connection, f'ix_products_{name}_id')
+
+
+@migration(8, 'roll up closed days only')
+def refold_daily_movements(connection):
+    # Rows for today and yesterday were kept up to date on every write
+    # before; those days are now read from the ledger instead.
+    replace_movements(connection)
+    return ('transactions',)
+
+
+@migration(9, 'product search trigram index', online=True)
+def reinstall_product_search(connection):
+    # SQLite swaps its word index for a trigram one, so name and SKU keep
+    # substring matching; other backends are unchanged.
+    backend_for(connection.dialect.name).install(connection, online=True)
+
+
+def applied_versions():
+    return set(db.session.scalars(select(SchemaMigration.version)))
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def _record(connection, version, name):
+    connection.execute(insert(SchemaMigration).values(
+        version=version, name=name, applied_at=datetime.utcnow()))
+
+
+def run_migrations(echo=None):
+    """Apply every pending migration in order.  Returns the versions run."""
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    pending = pending_migrations()
+    db.session.remove()
+    for version, name, online, fn in pending:
+        if echo:
+            echo(f'Applying {version}: {name}')
+        if online:
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                stamps = fn(connection)
+                _record(connection, version, name)
+        else:
+            with db.engine.begin() as connection:
+                stamps = fn(connection)
+                _record(connection, version, name)
+        for stamp in stamps or ():
+            cache.bump(stamp)
+    return [m[0] for m in pending]
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = run_migrations(echo=click.echo)
+    click.echo(f'Applied {len(applied)} migration(s).' if applied else 'Schema is up to date.')
+
+
+@app.cli.command('migrate-status')
+def migrate_status_command():
+    """List schema migrations and whether each has been applied."""
+    applied = applied_versions()
+    for version, name, online, fn in MIGRATIONS:
+        click.echo(f"{'applied' if version in applied else 'pending'}  {version}: {name}")
@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
@@ -13,10 +14,15 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256))
     role = db.Column(db.String(20), default='staff')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Incremented to invalidate every session issued to the user.
+    session_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
     
+    def revoke_sessions(self):
+        self.session_version = (self.session_version or 1) + 1
+    
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
@@ -39,6 +45,9 @@ class Category(db.Model):
 
 class Supplier(db.Model):
     __tablename__ = 'suppliers'
+    __table_args__ = (
+        db.Index('ix_suppliers_name_id', 'name', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -53,6 +62,19 @@ class Supplier(db.Model):
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.CheckConstraint('quantity >= 0', name='ck_products_quantity_non_negative'),
+        # Keyset pagination by name and the category filter; the other sort
+        # keys are indexed below, after the columns exist.
+        db.Index('ix_products_name_id', 'name', 'id'),
+        db.Index('ix_products_category_id_name_id', 'category_id', 'name', 'id'),
+        db.Index('ix_products_supplier_id', 'supplier_id'),
+        # Partial index holding only low-stock rows; the database keeps it
+        # current on every quantity or reorder-level change.
+        db.Index('ix_products_low_stock', 'quantity', 'id',
+                 postgresql_where=db.text('quantity <= reorder_level'),
+                 sqlite_where=db.text('quantity <= reorder_level')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(200), nullable=False)
@@ -76,8 +98,46 @@ class Product(db.Model):
         return self.quantity == 0
 
 
+# Nullable sort keys of the product list, with the value a NULL sorts as.
+# Keyset pagination compares row values, which never match NULL, so these
+# columns are sorted and seeked on coalesce(column, sentinel).  The sentinel
+# is a SQL literal rather than a bound parameter so queries match the
+# expression indexes exactly.
+PRODUCT_SORT_NULLS = {
+    'quantity': (0, '0'),
+    'selling_price': (0.0, '0'),
+    'created_at': (datetime(1970, 1, 1), "'1970-01-01 00:00:00.000000'"),
+}
+
+
+def product_sort_key(name):
+    column = getattr(Product, name)
+    if name not in PRODUCT_SORT_NULLS:
+        return column
+    return db.func.coalesce(column, db.literal_column(PRODUCT_SORT_NULLS[name][1]))
+
+
+def product_sort_value(product, name):
+    """The value of ``product_sort_key(name)`` for a loaded product."""
+    value = getattr(product, name)
+    if value is None and name in PRODUCT_SORT_NULLS:
+        return PRODUCT_SORT_NULLS[name][0]
+    return value
+
+
+for _name in PRODUCT_SORT_NULLS:
+    db.Index(f'ix_products_{_name}_sort', product_sort_key(_name), Product.id)
+
+
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # The history is read newest first by (created_at, id), optionally
+        # narrowed by type or product.
+        db.Index('ix_transactions_created_at_id', 'created_at', 'id'),
+        db.Index('ix_transactions_type_created_at_id', 'type', 'created_at', 'id'),
+        db.Index('ix_transactions_product_id_created_at_id', 'product_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
@@ -88,3 +148,67 @@ class Transaction(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     user = db.relationship('User', backref='transactions')
+
+
+class DailyStockMovement(db.Model):
+    __tablename__ = 'daily_stock_movements'
+
+    day = db.Column(db.Date, primary_key=True)
+    type = db.Column(db.String(20), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    filename = db.Column(db.String(255), nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    mode = db.Column(db.String(20), nullable=False, default='insert')
+    update_columns = db.Column(db.String(200))
+    bytes_total = db.Column(db.BigInteger, default=0)
+    bytes_processed = db.Column(db.BigInteger, default=0)
+    rows_processed = db.Column(db.Integer, default=0)
+    imported = db.Column(db.Integer, default=0)
+    updated = db.Column(db.Integer, default=0)
+    skipped = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text)
+    message = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'mode': self.mode,
+            'update_columns': self.update_columns.split(',') if self.update_columns else [],
+            'progress': round(100 * self.bytes_processed / self.bytes_total, 1) if self.bytes_total else 0,
+            'rows_processed': self.rows_processed,
+            'imported': self.imported,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'error_count': self.error_count,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,125 @@
+import threading
+from collections import defaultdict
+
+from sqlalchemy import event, inspect, select
+
+from app import db, cache
+from cache import is_next_stamp
+from models import Product
+
+
+# Version stamp for product names and SKUs.  Writers that bypass the ORM
+# (the CSV importer) mark it changed with ``versions.touch``.
+VERSION_NAME = 'product_search'
+GRAM_SIZE = 3
+_CHANGES = 'ngram_changes'
+
+
+def grams(text):
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+class NgramIndex:
+    """In-memory trigram index over product names and SKUs, one per worker.
+
+    A search intersects the posting sets of the term's trigrams and checks
+    the few candidates left for the substring, so it never touches the
+    database.  The index is built on first use.  Commits made through this
+    worker's ORM session are applied in place.  Any other change to the
+    ``product_search`` version stamp, from another worker or from a Core
+    bulk write, makes the next search rebuild it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = None
+        self._postings = None
+        self.stamp = None
+
+    def _add(self, id_, name, sku):
+        doc = ((name or '').lower(), (sku or '').lower())
+        self._docs[id_] = doc
+        for gram in grams(doc[0]) | grams(doc[1]):
+            self._postings[gram].add(id_)
+
+    def _remove(self, id_):
+        doc = self._docs.pop(id_, None)
+        if doc is None:
+            return
+        for gram in grams(doc[0]) | grams(doc[1]):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(id_)
+                if not postings:
+                    del self._postings[gram]
+
+    def _build(self):
+        # Read the stamp first: a commit that lands during the load bumps
+        # it again and triggers another rebuild rather than being missed.
+        self.stamp = cache.version(VERSION_NAME)
+        self._docs, self._postings = {}, defaultdict(set)
+        for id_, name, sku in db.session.execute(select(Product.id, Product.name, Product.sku)):
+            self._add(id_, name, sku)
+
+    def search(self, term):
+        """Return the ids of products whose name or SKU contains ``term``."""
+        term = term.lower()
+        with self._lock:
+            if self._docs is None or cache.version(VERSION_NAME) != self.stamp:
+                self._build()
+            if len(term) < GRAM_SIZE:
+                candidates = self._docs
+            else:
+                postings = sorted((self._postings.get(g, set()) for g in grams(term)), key=len)
+                candidates = set.intersection(*postings)
+            return [id_ for id_ in candidates
+                    if term in self._docs[id_][0] or term in self._docs[id_][1]]
+
+    def commit(self, changes):
+        """Apply ``{id: (name, sku) or None}`` from a committed session and
+        bump the version stamp so other workers rebuild."""
+        with self._lock:
+            stamp = cache.bump(VERSION_NAME)
+            if self._docs is None or not is_next_stamp(stamp, self.stamp):
+                # Stale already, or another worker bumped since our last
+                # load: its change is not in the index, so leave the old
+                # stamp and let the next search rebuild.
+                return
+            for id_, values in changes.items():
+                self._remove(id_)
+                if values is not None:
+                    self._add(id_, *values)
+            self.stamp = stamp
+
+
+index = NgramIndex()
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_products(session, flush_context):
+    changes = {}
+    for obj in session.new:
+        if isinstance(obj, Product):
+            changes[obj.id] = (obj.name, obj.sku)
+    for obj in session.dirty:
+        if isinstance(obj, Product):
+            state = inspect(obj)
+            if state.attrs.name.history.has_changes() or state.attrs.sku.history.has_changes():
+                changes[obj.id] = (obj.name, obj.sku)
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes[obj.id] = None
+    if changes:
+        session.info.setdefault(_CHANGES, {}).update(changes)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_products(session):
+    changes = session.info.pop(_CHANGES, None)
+    if changes:
+        index.commit(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_products(session):
+    session.info.pop(_CHANGES, None)
@@ -0,0 +1,135 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import func, tuple_
+
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+
+def get_per_page(value, default=DEFAULT_PER_PAGE):
+    if not value or value < 1:
+        return default
+    return min(value, MAX_PER_PAGE)
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    if value is None:
+        return None
+    if column.type.python_type is datetime:
+        return datetime.fromisoformat(value)
+    return column.type.python_type(value)
+
+
+def encode_cursor(key, values, direction):
+    payload = json.dumps({'k': key, 'v': [_dump_value(v) for v in values], 'd': direction},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, key, columns):
+    """Return (values, direction) for a cursor, or None if it is missing or
+    was issued for a different sort key."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if payload.get('k') != key or payload.get('d') not in ('next', 'prev'):
+            return None
+        values = [_load_value(c, v) for c, v in zip(columns, payload['v'])]
+        if len(values) != len(columns) or None in values:
+            return None
+        return values, payload['d']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, prev_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def keyset_paginate(query, columns, key, cursor=None, per_page=DEFAULT_PER_PAGE, descending=False,
+                    row_values=None):
+    """Seek-paginate ``query`` ordered by ``columns`` (the last one must be a
+    unique tiebreaker such as the primary key).
+
+    Instead of OFFSET, each page filters on the row-value of the last row seen,
+    so fetching page N costs the same as page 1 given an index on ``columns``.
+    ``key`` identifies the sort so stale cursors from another ordering are
+    ignored.  ``row_values`` extracts the sort values from a result row; by
+    default they are read as attributes named after the columns.
+    """
+    if row_values is None:
+        def row_values(row):
+            return [getattr(row, c.key) for c in columns]
+
+    decoded = decode_cursor(cursor, key, columns)
+    values, direction = decoded if decoded else (None, 'next')
+    backwards = direction == 'prev'
+
+    # Walking backwards flips the ordering; the rows are reversed afterwards.
+    reverse_order = descending != backwards
+    if values is not None:
+        row = tuple_(*columns)
+        bound = tuple_(*values)
+        query = query.filter(row < bound if reverse_order else row > bound)
+    query = query.order_by(*[c.desc() if reverse_order else c.asc() for c in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    if backwards:
+        more_after, more_before = True, has_more
+    else:
+        more_after, more_before = has_more, values is not None
+
+    next_cursor = prev_cursor = None
+    if rows and more_after:
+        next_cursor = encode_cursor(key, row_values(rows[-1]), 'next')
+    if rows and more_before:
+        prev_cursor = encode_cursor(key, row_values(rows[0]), 'prev')
+
+    return KeysetPage(rows, next_cursor, prev_cursor, per_page)
+
+
+def capped_count(query, cap):
+    """Count the rows of ``query`` but stop after ``cap + 1`` of them, so the
+    cost stays bounded on very large tables.  Returns (count, is_exact)."""
+    limited = query.order_by(None).limit(cap + 1).subquery()
+    total = query.session.query(func.count()).select_from(limited).scalar()
+    if total > cap:
+        return cap, False
+    return total, True
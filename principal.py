@@ -0,0 +1,100 @@
+import click
+from flask import session
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+
+from app import app, db, cache
+from models import User
+from versions import current, touch
+
+
+# Session key holding the signed principal issued at login.
+SESSION_KEY = '_principal'
+# Session key holding the user's session_version at login.  Checked
+# whenever the user row is read, with or without SESSION_PRINCIPAL; a
+# session without it predates revocation and counts as revoked.
+VERSION_KEY = '_session_version'
+
+
+class Principal(UserMixin):
+    """The parts of a User that requests need, rebuilt from the session."""
+
+    def __init__(self, id, username, role):
+        self.id = id
+        self.username = username
+        self.role = role
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+    def is_staff(self):
+        return self.role == 'staff'
+
+
+def stamp_name(user_id):
+    return f'user-{user_id}'
+
+
+def start(user):
+    """Record a login in the session, after ``login_user``."""
+    session[VERSION_KEY] = user.session_version
+    if app.config['SESSION_PRINCIPAL']:
+        issue(user)
+
+
+def is_current(user):
+    """Whether the session was issued since ``user``'s last revocation."""
+    return user is not None and session.get(VERSION_KEY) == user.session_version
+
+
+def issue(user):
+    """Store ``user``'s principal in the session, stamped with the user's
+    current cross-worker version."""
+    stamp, = current(stamp_name(user.id))
+    session[SESSION_KEY] = {'id': user.id, 'username': user.username, 'role': user.role,
+                            's': stamp}
+
+
+def load(user_id):
+    """Hydrate the current user from the session principal.
+
+    The database is only read when the user's version stamp has moved
+    since the principal was issued, i.e. after the user row changed.  The
+    principal is then reissued, unless the session was revoked since.
+    """
+    data = session.get(SESSION_KEY)
+    user_id = int(user_id)
+    if (data and VERSION_KEY in session and data['id'] == user_id
+            and data['s'] == cache.version(stamp_name(user_id))):
+        return Principal(data['id'], data['username'], data['role'])
+
+    user = db.session.get(User, user_id)
+    if not is_current(user):
+        clear()
+        return None
+    issue(user)
+    return Principal(user.id, user.username, user.role)
+
+
+def clear():
+    session.pop(SESSION_KEY, None)
+    session.pop(VERSION_KEY, None)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_users(session_, flush_context):
+    for obj in session_.dirty | session_.deleted:
+        if isinstance(obj, User) and inspect(obj).has_identity:
+            touch(session_, stamp_name(obj.id))
+
+
+@app.cli.command('revoke-sessions')
+@click.argument('username')
+def revoke_sessions_command(username):
+    """Sign a user out of every session."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No user named {username}')
+    user.revoke_sessions()
+    db.session.commit()
+    click.echo(f'Revoked sessions for {username}.')
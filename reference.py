@@ -0,0 +1,40 @@
+from collections import namedtuple
+
+from sqlalchemy import select
+
+from app import db, cache
+from models import Category, Supplier
+
+
+Option = namedtuple('Option', 'id name')
+
+MODELS = {'categories': Category, 'suppliers': Supplier}
+
+# name -> (version stamp, options); one copy per worker.
+_loaded = {}
+
+
+def options(name):
+    """The ``(id, name)`` rows of a reference table, sorted by name.
+
+    Served from this worker's memory while the table's version stamp is
+    unchanged; ORM writes to the table (and the importer's Core inserts)
+    bump the stamp on commit, so every worker reloads on its next request.
+    """
+    stamp = cache.version(name)
+    entry = _loaded.get(name)
+    if entry is None or entry[0] != stamp:
+        model = MODELS[name]
+        rows = db.session.execute(select(model.id, model.name).order_by(model.name))
+        entry = (stamp, tuple(Option(*row) for row in rows))
+        _loaded[name] = entry
+    return entry[1]
+
+
+def categories():
+    return options('categories')
+
+
+def suppliers():
+    return options('suppliers')
+
@@ -0,0 +1,262 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+import click
+from sqlalchemy import delete, event, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import app, db
+from models import Transaction, DailyStockMovement
+from versions import touch
+
+
+# Whole days are folded into the rollup once they are closed; movements
+# from ``open_from()`` on are summed from the ledger when read (an indexed
+# range scan of a day or two).  Stock writes therefore never update the
+# shared (day, type) rows, so sales of different products do not queue on
+# one row lock.  Yesterday stays open so a movement stamped just before
+# midnight but committed after it is still picked up.
+OPEN_DAYS = 2
+
+
+def open_from():
+    """The first day that is read from the ledger rather than folded."""
+    return datetime.utcnow().date() - timedelta(days=OPEN_DAYS - 1)
+
+
+def midnight(day):
+    return datetime.combine(day, time())
+
+
+def upsert_insert(dialect_name):
+    """Return the dialect's ON CONFLICT-capable insert(), or None."""
+    if dialect_name == 'postgresql':
+        return postgresql.insert
+    if dialect_name == 'sqlite':
+        return sqlite.insert
+    return None
+
+
+def lock_rollup(connection):
+    if connection.dialect.name == 'postgresql':
+        # Folding and corrections take this lock, so a correction cannot
+        # miss a day that is being folded at the same moment.  Plain reads
+        # are not blocked.
+        connection.exec_driver_sql('LOCK TABLE daily_stock_movements IN EXCLUSIVE MODE')
+
+
+def folded_through(connection):
+    """The last day in the rollup, or None; later days are read from the ledger."""
+    return connection.scalar(select(func.max(DailyStockMovement.day)))
+
+
+def apply_movements(connection, totals):
+    """Add ``{(day, type): (quantity, count)}`` deltas to the rollup table.
+
+    Only days already folded are written; later ones are read from the
+    ledger anyway.  The update is additive (``quantity = quantity +
+    excluded.quantity``) so concurrent writers never overwrite each other's
+    totals, and rows are written in (day, type) order so two writers
+    cannot deadlock on each other's row locks.
+    """
+    if not totals:
+        return
+    lock_rollup(connection)
+    last = folded_through(connection)
+    if last is None:
+        return
+    table = DailyStockMovement.__table__
+    rows = [{'day': day, 'type': type_, 'quantity': qty, 'transaction_count': count}
+            for (day, type_), (qty, count) in sorted(totals.items()) if day <= last]
+    if not rows:
+        return
+
+    insert = upsert_insert(connection.dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.type],
+            set_={
+                'quantity': table.c.quantity + stmt.excluded.quantity,
+                'transaction_count': table.c.transaction_count + stmt.excluded.transaction_count,
+            })
+        connection.execute(stmt)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(table.c.day == row['day'], table.c.type == row['type'])
+            .values(quantity=table.c.quantity + row['quantity'],
+                    transaction_count=table.c.transaction_count + row['transaction_count']))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def add_movement(totals, created_at, type_, quantity, sign=1):
+    entry = totals[(created_at.date(), type_)]
+    totals[(created_at.date(), type_)] = (entry[0] + sign * quantity, entry[1] + sign)
+
+
+def movement_totals():
+    return defaultdict(lambda: (0, 0))
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_transactions(session, flush_context):
+    # New ledger rows are dated now, which is never folded yet; only
+    # deletions can change days already in the rollup.
+    totals = movement_totals()
+    for obj in session.deleted:
+        if isinstance(obj, Transaction) and obj.created_at is not None:
+            add_movement(totals, obj.created_at, obj.type, obj.quantity, sign=-1)
+    if totals:
+        apply_movements(session.connection(), totals)
+
+
+def remove_product_movements(product_id):
+    """Subtract a product's ledger rows from the rollup before they are
+    bulk-deleted (bulk deletes bypass the flush hook)."""
+    day = func.date(Transaction.created_at)
+    rows = db.session.query(
+        day, Transaction.type, func.sum(Transaction.quantity), func.count(Transaction.id)
+    ).filter(Transaction.product_id == product_id).group_by(day, Transaction.type).all()
+
+    totals = movement_totals()
+    for row_day, type_, qty, count in rows:
+        totals[(as_date(row_day), type_)] = (-qty, -count)
+    apply_movements(db.session.connection(), totals)
+    touch(db.session, 'transactions')
+
+
+def as_date(value):
+    # date() comes back as a string on SQLite.
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def ledger_totals(start=None, end=None):
+    """``select`` of (day, type, quantity, count) from the ledger for
+    ``start <= day < end``."""
+    day = func.date(Transaction.created_at)
+    query = (select(day, Transaction.type, func.sum(Transaction.quantity), func.count(Transaction.id))
+             .where(Transaction.created_at.is_not(None))
+             .group_by(day, Transaction.type))
+    if start is not None:
+        query = query.where(Transaction.created_at >= midnight(start))
+    if end is not None:
+        query = query.where(Transaction.created_at < midnight(end))
+    return query
+
+
+def _fold(connection, start):
+    connection.execute(DailyStockMovement.__table__.insert().from_select(
+        ['day', 'type', 'quantity', 'transaction_count'], ledger_totals(start, open_from())))
+
+
+def fold_closed_days(connection):
+    """Add closed days not yet in the rollup, in the caller's transaction.
+    Returns True if any rows were added."""
+    last = folded_through(connection)
+    start = last + timedelta(days=1) if last else None
+    pending = select(Transaction.id).where(Transaction.created_at < midnight(open_from()))
+    if start is not None:
+        pending = pending.where(Transaction.created_at >= midnight(start))
+    if connection.execute(pending.limit(1)).first() is None:
+        return False
+    lock_rollup(connection)
+    last = folded_through(connection)
+    _fold(connection, last + timedelta(days=1) if last else None)
+    return True
+
+
+def replace_movements(connection):
+    """Replace the rollup rows with totals of every closed day recomputed
+    from the ledger, in the caller's transaction."""
+    # Waits for corrections in flight and holds back new ones until commit,
+    # so every movement is counted exactly once.
+    lock_rollup(connection)
+    connection.execute(delete(DailyStockMovement.__table__))
+    _fold(connection, None)
+
+
+def rebuild_movements():
+    """Recompute the whole rollup table from the transaction ledger."""
+    replace_movements(db.session.connection())
+    touch(db.session, 'transactions')
+    db.session.commit()
+    return db.session.query(func.count()).select_from(DailyStockMovement).scalar()
+
+
+@app.cli.command('rebuild-movements')
+def rebuild_movements_command():
+    """Rebuild the daily stock movement rollup from the ledger."""
+    count = rebuild_movements()
+    click.echo(f'Rebuilt daily stock movements: {count} rows.')
+
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    if bucket == 'month':
+        return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def bucket_count(start, end, bucket):
+    if bucket == 'week':
+        return (bucket_start(end, 'week') - bucket_start(start, 'week')).days // 7 + 1
+    if bucket == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return (end - start).days + 1
+
+
+BUCKET_LABELS = {'day': '%b %d', 'week': '%b %d', 'month': '%b %Y'}
+
+
+def movement_series(start, end, bucket):
+    """Purchase and sale totals per ``bucket`` ('day', 'week' or 'month')
+    between two dates inclusive: folded days from the rollup table, the
+    rest from the ledger."""
+    if fold_closed_days(db.session.connection()):
+        db.session.commit()
+
+    # The boundary is read first; a fold committing meanwhile only adds
+    # later days, which are then still read from the ledger.
+    last = folded_through(db.session.connection())
+    rows = []
+    if last is not None:
+        rows += db.session.query(
+            DailyStockMovement.day, DailyStockMovement.type, DailyStockMovement.quantity
+        ).filter(DailyStockMovement.day >= start,
+                 DailyStockMovement.day <= min(end, last)).all()
+    ledger_start = max(start, last + timedelta(days=1)) if last is not None else start
+    if ledger_start <= end:
+        rows += [(as_date(day), type_, qty) for day, type_, qty, _ in db.session.execute(
+            ledger_totals(ledger_start, end + timedelta(days=1)))]
+
+    totals = {'purchase': defaultdict(int), 'sale': defaultdict(int)}
+    for day, type_, quantity in rows:
+        if type_ in totals:
+            totals[type_][bucket_start(day, bucket)] += quantity
+
+    labels, purchases, sales = [], [], []
+    current = bucket_start(start, bucket)
+    while current <= end:
+        labels.append(current.strftime(BUCKET_LABELS[bucket]))
+        purchases.append(totals['purchase'].get(current, 0))
+        sales.append(totals['sale'].get(current, 0))
+        current = next_bucket(current, bucket)
+    return labels, purchases, sales
+
+
+def first_movement_day():
+    first = db.session.query(func.min(Transaction.created_at)).scalar()
+    return first.date() if first else None
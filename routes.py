@@ -1,12 +1,76 @@
 import csv
+import hashlib
 import io
-from datetime import datetime, timedelta
-from flask import render_template, redirect, url_for, flash, request, Response, make_response
+import zlib
+from datetime import datetime, time, timedelta, timezone
+from flask import render_template, redirect, url_for, flash, request, Response, make_response, stream_with_context, session
 from flask_login import login_user, logout_user, login_required, current_user
-from app import app, db, login_manager
-from models import User, Product, Category, Supplier, Transaction
-from sqlalchemy import or_, and_, func
+from app import app, db, login_manager, cache
+from models import (User, Product, Category, Supplier, Transaction, ImportJob,
+                    product_sort_key, product_sort_value)
+from sqlalchemy import func, case
+from sqlalchemy.orm import joinedload
 from functools import wraps
+from pagination import keyset_paginate, get_per_page, capped_count
+from rollups import remove_product_movements, movement_series, bucket_count, first_movement_day
+import versions
+import reference
+import principal
+from jobs import enqueue_import
+from stock import adjust_stock, apply_stock_batch, MAX_BATCH_LINES
+from group_commit import group_committer
+from importer import IMPORT_MODES, UPDATABLE_COLUMNS, DEFAULT_UPDATE_COLUMNS
+from search import search_backend
+
+
+PRODUCT_SORT_COLUMNS = {name: product_sort_key(name)
+                        for name in ('name', 'quantity', 'selling_price', 'created_at')}
+
+# Chart windows for /api/dashboard-stats: (days, default bucket).  Buckets
+# are coarsened automatically so no response exceeds CHART_MAX_POINTS.
+CHART_WINDOWS = {
+    '7d': (7, 'day'),
+    '30d': (30, 'day'),
+    '90d': (90, 'week'),
+    '1y': (365, 'week'),
+    'all': (None, 'month'),
+}
+BUCKET_ORDER = {'day': 0, 'week': 1, 'month': 2}
+CHART_MAX_POINTS = 120
+CHART_CACHE_TTL = 3600
+
+# Rows fetched per round trip (and written per chunk) by the CSV exports.
+EXPORT_BATCH_SIZE = 1000
+
+# The transaction history never counts past this many matching rows.
+TRANSACTION_COUNT_CAP = 10000
+# Suggestions returned by /api/products/autocomplete.
+AUTOCOMPLETE_LIMIT = 10
+MAX_AUTOCOMPLETE_LIMIT = 50
+
+
+def stream_csv(header, rows):
+    """Yield a CSV document one batch of lines at a time, reusing a single
+    small buffer so memory stays flat however many rows there are."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def csv_response(header, rows, filename):
+    response = Response(stream_with_context(stream_csv(header, rows)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
 
 
 def admin_required(f):
@@ -19,13 +83,67 @@ def admin_required(f):
     return decorated_function
 
 
+def conditional(*tables, daily=False):
+    """Answer with 304 Not Modified while ``tables`` are unchanged.
+
+    The ETag hashes the tables' version stamps with the URL and the viewer,
+    so it is known before the view runs any query.  Last-Modified (the
+    latest bump) is sent for information only.  ``daily`` views also change
+    at midnight (UTC).  Pages with flashed messages waiting are always
+    rendered.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if session.get('_flashes'):
+                return f(*args, **kwargs)
+
+            parts = [request.full_path, current_user.id, current_user.username, current_user.role,
+                     *versions.current(*tables)]
+            last_modified = versions.last_modified(*tables)
+            if daily:
+                midnight = datetime.combine(datetime.utcnow().date(), time(), timezone.utc)
+                parts.append(midnight.date().isoformat())
+                last_modified = max(last_modified, midnight) if last_modified else midnight
+            etag = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+            # Only the ETag is trusted: Last-Modified has one-second
+            # resolution, and two bumps in the same second would look equal.
+            not_modified = request.if_none_match.contains(etag)
+
+            response = make_response('', 304) if not_modified else make_response(f(*args, **kwargs))
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+
+# Loader options for list views, so each page issues a fixed number of
+# queries instead of one lazy load per row and relationship.  The backref
+# attributes only exist once the mappers are configured, hence functions.
+def product_list_options():
+    return joinedload(Product.category), joinedload(Product.supplier)
+
+
+def transaction_list_options():
+    return joinedload(Transaction.product), joinedload(Transaction.user)
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    if app.config['SESSION_PRINCIPAL']:
+        return principal.load(user_id)
+    user = User.query.get(int(user_id))
+    return user if principal.is_current(user) else None
 
 
+# The startup checks select only the id, so the app (and ``flask migrate``)
+# can still start against a users table that is missing newer columns.
 def create_default_admin():
-    admin = User.query.filter_by(username='admin').first()
+    admin = db.session.query(User.id).filter_by(username='admin').first()
     if not admin:
         admin = User(username='admin', email='admin@inventory.local', role='admin')
         admin.set_password('admin123')
@@ -33,7 +151,7 @@ def create_default_admin():
         db.session.commit()
 
 def create_default_staff():
-    staff = User.query.filter_by(username='staff').first()
+    staff = db.session.query(User.id).filter_by(username='staff').first()
     if not staff:
         staff = User(
             username='staff',
@@ -70,6 +188,7 @@ def login():
         
         if user and user.check_password(password):
             login_user(user)
+            principal.start(user)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
             return redirect(next_page or url_for('dashboard'))
@@ -82,67 +201,108 @@ def login():
 @login_required
 def logout():
     logout_user()
+    principal.clear()
     flash('You have been logged out.', 'info')
     return redirect(url_for('login'))
 
 
-@app.route('/dashboard')
-@login_required
-def dashboard():
-    total_products = Product.query.count()
-    total_stock = db.session.query(db.func.sum(Product.quantity)).scalar() or 0
-    low_stock_count = Product.query.filter(Product.quantity <= Product.reorder_level).count()
-    out_of_stock_count = Product.query.filter(Product.quantity == 0).count()
-    
-    low_stock_products = Product.query.filter(
+def build_dashboard_summary():
+    total_products, total_stock, low_stock_count, out_of_stock_count = db.session.query(
+        func.count(Product.id),
+        func.coalesce(func.sum(Product.quantity), 0),
+        func.count(case((Product.quantity <= Product.reorder_level, 1))),
+        func.count(case((Product.quantity == 0, 1)))
+    ).one()
+
+    # Read from the ix_products_low_stock partial index, which only holds
+    # the low rows.
+    low_stock_products = db.session.query(
+        Product.name, Product.sku, Product.quantity, Product.reorder_level
+    ).filter(
         Product.quantity <= Product.reorder_level
-    ).order_by(Product.quantity.asc()).limit(5).all()
-    
-    recent_transactions = Transaction.query.order_by(
+    ).order_by(Product.quantity.asc(), Product.id.asc()).limit(5).all()
+
+    recent_transactions = db.session.query(
+        Transaction.type, Transaction.quantity, Transaction.created_at, Product.name
+    ).join(Product, Transaction.product_id == Product.id).order_by(
         Transaction.created_at.desc()
     ).limit(10).all()
-    
-    return render_template('dashboard.html',
-                           total_products=total_products,
-                           total_stock=total_stock,
-                           low_stock_count=low_stock_count,
-                           out_of_stock_count=out_of_stock_count,
-                           low_stock_products=low_stock_products,
-                           recent_transactions=recent_transactions)
+
+    # Plain values only, so the snapshot can be shared between workers.
+    return {
+        'total_products': total_products,
+        'total_stock': total_stock,
+        'low_stock_count': low_stock_count,
+        'out_of_stock_count': out_of_stock_count,
+        'low_stock_products': [p._asdict() for p in low_stock_products],
+        'recent_transactions': [
+            {'type': t.type, 'quantity': t.quantity, 'created_at': t.created_at,
+             'product': {'name': t.name}}
+            for t in recent_transactions
+        ],
+    }
+
+
+@app.route('/dashboard')
+@login_required
+def dashboard():
+    summary = cache.get_or_set('dashboard', app.config['DASHBOARD_CACHE_TTL'],
+                               build_dashboard_summary)
+    return render_template('dashboard.html', **summary)
 
 
 @app.route('/products')
 @login_required
+@conditional('products', 'categories', 'suppliers')
 def products():
     search = request.args.get('search', '')
     category_id = request.args.get('category', type=int)
-    sort_by = request.args.get('sort', 'name')
+    # An empty sort means relevance when searching and name otherwise.
+    sort_by = request.args.get('sort', '')
     order = request.args.get('order', 'asc')
-    
-    query = Product.query
-    
+    cursor = request.args.get('cursor')
+    per_page = get_per_page(request.args.get('per_page', type=int))
+
+    if sort_by not in PRODUCT_SORT_COLUMNS:
+        sort_by = ''
+    if order != 'desc':
+        order = 'asc'
+
+    query = Product.query.options(*product_list_options())
+    rank = None
+
     if search:
-        query = query.filter(
-            or_(
-                Product.name.ilike(f'%{search}%'),
-                Product.sku.ilike(f'%{search}%')
-            )
-        )
-    
+        query, rank = search_backend(db.session).apply(query, search)
+
     if category_id:
         query = query.filter(Product.category_id == category_id)
-    
-    sort_column = getattr(Product, sort_by, Product.name)
-    if order == 'desc':
-        query = query.order_by(sort_column.desc())
+
+    if not sort_by and rank is not None:
+        # Best match first; the search text is part of the key so a cursor
+        # from another search is ignored.
+        page = keyset_paginate(query.add_columns(rank.label('search_rank')),
+                               (rank, Product.id),
+                               key=f'products:relevance:{zlib.crc32(search.encode())}',
+                               cursor=cursor,
+                               per_page=per_page,
+                               descending=True,
+                               row_values=lambda row: [row.search_rank, row.Product.id])
+        page.items = [row.Product for row in page.items]
     else:
-        query = query.order_by(sort_column.asc())
-    
-    products_list = query.all()
-    categories = Category.query.order_by(Category.name).all()
-    
+        column = sort_by or 'name'
+        page = keyset_paginate(query,
+                               (PRODUCT_SORT_COLUMNS[column], Product.id),
+                               key=f'products:{column}:{order}',
+                               cursor=cursor,
+                               per_page=per_page,
+                               descending=order == 'desc',
+                               row_values=lambda p: [product_sort_value(p, column), p.id])
+    categories = reference.categories()
+
     return render_template('products.html',
-                           products=products_list,
+                           products=page.items,
+                           page=page,
+                           per_page=per_page,
                            categories=categories,
                            search=search,
                            category_id=category_id,
@@ -150,6 +310,23 @@ def products():
                            order=order)
 
 
+@app.route('/api/products/autocomplete')
+@login_required
+def product_autocomplete():
+    """Top matches by name or SKU for the product pickers."""
+    term = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int) or AUTOCOMPLETE_LIMIT,
+                MAX_AUTOCOMPLETE_LIMIT)
+    if not term:
+        return {'products': []}
+
+    query, rank = search_backend(db.session).apply(
+        db.session.query(Product.id, Product.name, Product.sku), term, description=False)
+    order = (rank.desc(), Product.name) if rank is not None else (Product.name,)
+    rows = query.order_by(*order).limit(limit).all()
+    return {'products': [{'id': r.id, 'name': r.name, 'sku': r.sku} for r in rows]}
+
+
 @app.route('/products/add', methods=['GET', 'POST'])
 @login_required
 def add_product():
@@ -167,6 +344,8 @@ def add_product():
         existing = Product.query.filter_by(sku=sku).first()
         if existing:
             flash('A product with this SKU already exists.', 'error')
+        elif quantity < 0:
+            flash('Quantity cannot be negative.', 'error')
         else:
             product = Product(
                 name=name,
@@ -195,8 +374,8 @@ def add_product():
             flash('Product added successfully!', 'success')
             return redirect(url_for('products'))
     
-    categories = Category.query.order_by(Category.name).all()
-    suppliers = Supplier.query.order_by(Supplier.name).all()
+    categories = reference.categories()
+    suppliers = reference.suppliers()
     return render_template('product_form.html',
                            product=None,
                            categories=categories,
@@ -217,8 +396,8 @@ def edit_product(id):
             existing = Product.query.filter_by(sku=new_sku).first()
             if existing:
                 flash('A product with this SKU already exists.', 'error')
-                categories = Category.query.order_by(Category.name).all()
-                suppliers = Supplier.query.order_by(Supplier.name).all()
+                categories = reference.categories()
+                suppliers = reference.suppliers()
                 return render_template('product_form.html',
                                        product=product,
                                        categories=categories,
@@ -239,8 +418,8 @@ def edit_product(id):
         flash('Product updated successfully!', 'success')
         return redirect(url_for('products'))
     
-    categories = Category.query.order_by(Category.name).all()
-    suppliers = Supplier.query.order_by(Supplier.name).all()
+    categories = reference.categories()
+    suppliers = reference.suppliers()
     return render_template('product_form.html',
                            product=product,
                            categories=categories,
@@ -256,6 +435,7 @@ def delete_product(id):
         return redirect(url_for('products'))
     
     product = Product.query.get_or_404(id)
+    remove_product_movements(id)
     Transaction.query.filter_by(product_id=id).delete()
     db.session.delete(product)
     db.session.commit()
@@ -263,6 +443,23 @@ def delete_product(id):
     return redirect(url_for('products'))
 
 
+def record_stock_movement(product_id, transaction_type, quantity, notes):
+    """Apply and commit one movement, through the group committer when
+    GROUP_COMMIT is enabled.  Returns False if a sale exceeds stock."""
+    user_id = current_user.id
+    if app.config['GROUP_COMMIT']:
+        # The writer thread updates the row in its own session.
+        db.session.rollback()
+        return group_committer.submit(product_id, transaction_type, quantity,
+                                      notes, user_id)
+    if adjust_stock(db.session, product_id, transaction_type, quantity,
+                    notes, user_id) is None:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
 @app.route('/products/<int:id>/stock', methods=['GET', 'POST'])
 @login_required
 def update_stock(id):
@@ -273,49 +470,70 @@ def update_stock(id):
         quantity = int(request.form.get('quantity', 0))
         notes = request.form.get('notes', '')
         
+        transaction_type = 'purchase' if action == 'purchase' else 'sale'
+        
         if quantity <= 0:
             flash('Quantity must be greater than 0.', 'error')
-        elif action == 'sale' and quantity > product.quantity:
+        elif not record_stock_movement(product.id, transaction_type, quantity, notes):
             flash('Cannot sell more than available stock.', 'error')
         else:
-            if action == 'purchase':
-                product.quantity += quantity
-                transaction_type = 'purchase'
-            else:
-                product.quantity -= quantity
-                transaction_type = 'sale'
-            
-            transaction = Transaction(
-                product_id=product.id,
-                type=transaction_type,
-                quantity=quantity,
-                notes=notes,
-                user_id=current_user.id
-            )
-            db.session.add(transaction)
-            db.session.commit()
-            
             flash(f'Stock {action} recorded successfully!', 'success')
             return redirect(url_for('products'))
     
     return render_template('stock_form.html', product=product)
 
 
+@app.route('/api/stock/batch', methods=['POST'])
+@login_required
+def batch_update_stock():
+    payload = request.get_json(silent=True)
+    lines = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(lines, list) or not lines:
+        return {'error': 'Expected a JSON list of stock lines or {"items": [...]}.'}, 400
+    if len(lines) > MAX_BATCH_LINES:
+        return {'error': f'At most {MAX_BATCH_LINES} lines per request.'}, 400
+    
+    results = apply_stock_batch(db.session, lines, current_user.id)
+    db.session.commit()
+    
+    applied = sum(1 for r in results if r['status'] == 'ok')
+    return {
+        'applied': applied,
+        'failed': len(results) - applied,
+        'results': results
+    }
+
+
 @app.route('/low-stock')
 @login_required
+@conditional('products', 'categories', 'suppliers')
 def low_stock():
-    products_list = Product.query.filter(
+    products_list = Product.query.options(*product_list_options()).filter(
         Product.quantity <= Product.reorder_level
-    ).order_by(Product.quantity.asc()).all()
+    ).order_by(Product.quantity.asc(), Product.id.asc()).all()
     
     return render_template('low_stock.html', products=products_list)
 
 
 @app.route('/categories')
 @login_required
+@conditional('categories', 'products')
 def categories():
-    categories_list = Category.query.order_by(Category.name).all()
-    return render_template('categories.html', categories=categories_list)
+    per_page = get_per_page(request.args.get('per_page', type=int))
+    product_count = db.session.query(func.count(Product.id)).filter(
+        Product.category_id == Category.id
+    ).correlate(Category).scalar_subquery().label('product_count')
+
+    page = keyset_paginate(db.session.query(Category, product_count),
+                           (Category.name, Category.id),
+                           key='categories',
+                           cursor=request.args.get('cursor'),
+                           per_page=per_page,
+                           row_values=lambda row: (row.Category.name, row.Category.id))
+    return render_template('categories.html',
+                           categories=page.items,
+                           page=page,
+                           per_page=per_page)
 
 
 @app.route('/categories/add', methods=['POST'])
@@ -377,8 +595,21 @@ def delete_category(id):
 @app.route('/suppliers')
 @login_required
 def suppliers():
-    suppliers_list = Supplier.query.order_by(Supplier.name).all()
-    return render_template('suppliers.html', suppliers=suppliers_list)
+    per_page = get_per_page(request.args.get('per_page', type=int))
+    product_count = db.session.query(func.count(Product.id)).filter(
+        Product.supplier_id == Supplier.id
+    ).correlate(Supplier).scalar_subquery().label('product_count')
+
+    page = keyset_paginate(db.session.query(Supplier, product_count),
+                           (Supplier.name, Supplier.id),
+                           key='suppliers',
+                           cursor=request.args.get('cursor'),
+                           per_page=per_page,
+                           row_values=lambda row: (row.Supplier.name, row.Supplier.id))
+    return render_template('suppliers.html',
+                           suppliers=page.items,
+                           page=page,
+                           per_page=per_page)
 
 
 @app.route('/suppliers/add', methods=['GET', 'POST'])
@@ -437,16 +668,8 @@ def delete_supplier(id):
     return redirect(url_for('suppliers'))
 
 
-@app.route('/transactions')
-@login_required
-def transactions():
-    filter_type = request.args.get('type', 'all')
-    date_from = request.args.get('date_from', '')
-    date_to = request.args.get('date_to', '')
-    product_id = request.args.get('product_id', type=int)
-    
-    query = Transaction.query
-    
+def filter_transactions(query, filter_type, date_from, date_to, product_id):
+    """Apply the /transactions filters; shared by the list view and export."""
     if filter_type == 'purchase':
         query = query.filter(Transaction.type == 'purchase')
     elif filter_type == 'sale':
@@ -469,12 +692,38 @@ def transactions():
     if product_id:
         query = query.filter(Transaction.product_id == product_id)
     
-    transactions_list = query.order_by(Transaction.created_at.desc()).all()
-    products = Product.query.order_by(Product.name).all()
-    
+    return query
+
+
+@app.route('/transactions')
+@login_required
+def transactions():
+    filter_type = request.args.get('type', 'all')
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    product_id = request.args.get('product_id', type=int)
+    per_page = get_per_page(request.args.get('per_page', type=int))
+
+    query = filter_transactions(Transaction.query.options(*transaction_list_options()),
+                                filter_type, date_from, date_to, product_id)
+
+    total, total_exact = capped_count(query, TRANSACTION_COUNT_CAP)
+    page = keyset_paginate(query,
+                           (Transaction.created_at, Transaction.id),
+                           key='transactions',
+                           cursor=request.args.get('cursor'),
+                           per_page=per_page,
+                           descending=True)
+    # The product filter is an autocomplete; only the selected product is loaded.
+    selected_product = db.session.get(Product, product_id) if product_id else None
+
     return render_template('transactions.html',
-                           transactions=transactions_list,
-                           products=products,
+                           transactions=page.items,
+                           page=page,
+                           per_page=per_page,
+                           total=total,
+                           total_exact=total_exact,
+                           selected_product=selected_product,
                            filter_type=filter_type,
                            date_from=date_from,
                            date_to=date_to,
@@ -484,71 +733,71 @@ def transactions():
 @app.route('/export/products')
 @login_required
 def export_products():
-    products_list = Product.query.order_by(Product.name).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['ID', 'Name', 'SKU', 'Description', 'Category', 'Supplier', 
-                     'Purchase Price', 'Selling Price', 'Quantity', 'Reorder Level', 'Created At'])
-    
-    for p in products_list:
-        writer.writerow([
-            p.id,
-            p.name,
-            p.sku,
-            p.description or '',
-            p.category.name if p.category else '',
-            p.supplier.name if p.supplier else '',
-            p.purchase_price,
-            p.selling_price,
-            p.quantity,
-            p.reorder_level,
-            p.created_at.strftime('%Y-%m-%d %H:%M:%S')
-        ])
-    
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = 'attachment; filename=products_export.csv'
-    return response
+    query = db.session.query(
+        Product.id, Product.name, Product.sku, Product.description,
+        Category.name.label('category_name'), Supplier.name.label('supplier_name'),
+        Product.purchase_price, Product.selling_price, Product.quantity,
+        Product.reorder_level, Product.created_at
+    ).outerjoin(Category, Product.category_id == Category.id).outerjoin(
+        Supplier, Product.supplier_id == Supplier.id
+    ).order_by(Product.name).yield_per(EXPORT_BATCH_SIZE)
+
+    header = ['ID', 'Name', 'SKU', 'Description', 'Category', 'Supplier',
+              'Purchase Price', 'Selling Price', 'Quantity', 'Reorder Level', 'Created At']
+
+    def rows():
+        for p in query:
+            yield [
+                p.id,
+                p.name,
+                p.sku,
+                p.description or '',
+                p.category_name or '',
+                p.supplier_name or '',
+                p.purchase_price,
+                p.selling_price,
+                p.quantity,
+                p.reorder_level,
+                p.created_at.strftime('%Y-%m-%d %H:%M:%S') if p.created_at else ''
+            ]
+
+    return csv_response(header, rows(), 'products_export.csv')
 
 
 @app.route('/export/transactions')
 @login_required
 def export_transactions():
     filter_type = request.args.get('type', 'all')
-    
-    query = Transaction.query
-    if filter_type == 'purchase':
-        query = query.filter(Transaction.type == 'purchase')
-    elif filter_type == 'sale':
-        query = query.filter(Transaction.type == 'sale')
-    
-    transactions_list = query.order_by(Transaction.created_at.desc()).all()
-    
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['ID', 'Date', 'Product', 'SKU', 'Type', 'Quantity', 'Notes', 'User'])
-    
-    for t in transactions_list:
-        writer.writerow([
-            t.id,
-            t.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            t.product.name,
-            t.product.sku,
-            t.type.capitalize(),
-            t.quantity,
-            t.notes or '',
-            t.user.username if t.user else 'System'
-        ])
-    
-    output.seek(0)
-    response = make_response(output.getvalue())
-    response.headers['Content-Type'] = 'text/csv'
-    response.headers['Content-Disposition'] = f'attachment; filename=transactions_{filter_type}_export.csv'
-    return response
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    product_id = request.args.get('product_id', type=int)
+
+    query = db.session.query(
+        Transaction.id, Transaction.created_at, Product.name, Product.sku,
+        Transaction.type, Transaction.quantity, Transaction.notes, User.username
+    ).join(Product, Transaction.product_id == Product.id).outerjoin(
+        User, Transaction.user_id == User.id
+    )
+    query = filter_transactions(query, filter_type, date_from, date_to, product_id).order_by(
+        Transaction.created_at.desc(), Transaction.id.desc()
+    ).yield_per(EXPORT_BATCH_SIZE)
+
+    header = ['ID', 'Date', 'Product', 'SKU', 'Type', 'Quantity', 'Notes', 'User']
+
+    def rows():
+        for t in query:
+            yield [
+                t.id,
+                t.created_at.strftime('%Y-%m-%d %H:%M:%S') if t.created_at else '',
+                t.name,
+                t.sku,
+                t.type.capitalize(),
+                t.quantity,
+                t.notes or '',
+                t.username or 'System'
+            ]
+
+    return csv_response(header, rows(), f'transactions_{filter_type}_export.csv')
 
 
 @app.route('/import/products', methods=['GET', 'POST'])
@@ -569,123 +818,77 @@ def import_products():
             flash('Please upload a CSV file.', 'error')
             return redirect(url_for('import_products'))
         
-        try:
-            stream = io.StringIO(file.stream.read().decode('utf-8'))
-            reader = csv.DictReader(stream)
-            
-            imported = 0
-            skipped = 0
-            errors = []
-            
-            for row in reader:
-                try:
-                    sku = row.get('SKU', row.get('sku', '')).strip()
-                    if not sku:
-                        skipped += 1
-                        continue
-                    
-                    existing = Product.query.filter_by(sku=sku).first()
-                    if existing:
-                        skipped += 1
-                        errors.append(f"SKU '{sku}' already exists")
-                        continue
-                    
-                    name = row.get('Name', row.get('name', '')).strip()
-                    if not name:
-                        skipped += 1
-                        continue
-                    
-                    category_name = row.get('Category', row.get('category', '')).strip()
-                    category = None
-                    if category_name:
-                        category = Category.query.filter_by(name=category_name).first()
-                        if not category:
-                            category = Category(name=category_name)
-                            db.session.add(category)
-                            db.session.flush()
-                    
-                    supplier_name = row.get('Supplier', row.get('supplier', '')).strip()
-                    supplier = None
-                    if supplier_name:
-                        supplier = Supplier.query.filter_by(name=supplier_name).first()
-                        if not supplier:
-                            supplier = Supplier(name=supplier_name)
-                            db.session.add(supplier)
-                            db.session.flush()
-                    
-                    product = Product(
-                        name=name,
-                        sku=sku,
-                        description=row.get('Description', row.get('description', '')),
-                        purchase_price=float(row.get('Purchase Price', row.get('purchase_price', 0)) or 0),
-                        selling_price=float(row.get('Selling Price', row.get('selling_price', 0)) or 0),
-                        quantity=int(row.get('Quantity', row.get('quantity', 0)) or 0),
-                        reorder_level=int(row.get('Reorder Level', row.get('reorder_level', 10)) or 10),
-                        category_id=category.id if category else None,
-                        supplier_id=supplier.id if supplier else None
-                    )
-                    db.session.add(product)
-                    imported += 1
-                    
-                except Exception as e:
-                    skipped += 1
-                    errors.append(str(e))
-            
-            db.session.commit()
-            
-            if imported > 0:
-                flash(f'Successfully imported {imported} products.', 'success')
-            if skipped > 0:
-                flash(f'Skipped {skipped} rows (duplicates or invalid data).', 'warning')
-                
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Error importing file: {str(e)}', 'error')
+        mode = request.form.get('mode', 'insert')
+        update_columns = [c for c in request.form.getlist('update_columns') if c in UPDATABLE_COLUMNS]
+        if mode not in IMPORT_MODES:
+            mode = 'insert'
+        if mode == 'upsert' and not update_columns:
+            flash('Choose at least one column to update.', 'error')
+            return redirect(url_for('import_products'))
         
-        return redirect(url_for('products'))
+        job = enqueue_import(file, current_user.id, mode, update_columns)
+        flash('Import started. Progress is shown below.', 'info')
+        return redirect(url_for('import_products', job=job.id))
     
-    return render_template('import_products.html')
+    job_id = request.args.get('job', type=int)
+    job = db.session.get(ImportJob, job_id) if job_id else None
+    return render_template('import_products.html',
+                           job=job,
+                           updatable_columns=UPDATABLE_COLUMNS,
+                           default_update_columns=DEFAULT_UPDATE_COLUMNS)
+
+
+@app.route('/api/jobs/<int:id>')
+@login_required
+@admin_required
+def import_job_status(id):
+    job = db.session.get(ImportJob, id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    return job.to_dict()
 
 
 @app.route('/api/dashboard-stats')
 @login_required
+@conditional('transactions', daily=True)
 def dashboard_stats():
-    days = 30
-    end_date = datetime.utcnow()
-    start_date = end_date - timedelta(days=days)
-    
-    purchases = db.session.query(
-        func.date(Transaction.created_at).label('date'),
-        func.sum(Transaction.quantity).label('total')
-    ).filter(
-        Transaction.type == 'purchase',
-        Transaction.created_at >= start_date
-    ).group_by(func.date(Transaction.created_at)).all()
-    
-    sales = db.session.query(
-        func.date(Transaction.created_at).label('date'),
-        func.sum(Transaction.quantity).label('total')
-    ).filter(
-        Transaction.type == 'sale',
-        Transaction.created_at >= start_date
-    ).group_by(func.date(Transaction.created_at)).all()
-    
-    dates = []
-    purchase_data = []
-    sale_data = []
-    
-    purchase_dict = {str(p.date): p.total for p in purchases}
-    sale_dict = {str(s.date): s.total for s in sales}
-    
-    for i in range(days):
-        date = start_date + timedelta(days=i)
-        date_str = date.strftime('%Y-%m-%d')
-        dates.append(date.strftime('%b %d'))
-        purchase_data.append(purchase_dict.get(date_str, 0))
-        sale_data.append(sale_dict.get(date_str, 0))
-    
-    return {
-        'labels': dates,
+    window = request.args.get('window', '30d')
+    if window not in CHART_WINDOWS:
+        window = '30d'
+    bucket = request.args.get('bucket', CHART_WINDOWS[window][1])
+    if bucket not in ('day', 'week', 'month'):
+        bucket = CHART_WINDOWS[window][1]
+
+    # Read the version before computing so a commit that lands meanwhile
+    # invalidates what we store.
+    version = versions.current('transactions')
+    today = datetime.utcnow().date()
+    key = f'chart-{window}-{bucket}'
+    cached = cache.get(key, CHART_CACHE_TTL)
+    if cached and tuple(cached['version']) == version and cached['today'] == today:
+        return cached['data']
+
+    days = CHART_WINDOWS[window][0]
+    if days is None:
+        start_date = first_movement_day() or today
+    else:
+        start_date = today - timedelta(days=days - 1)
+
+    # Coarsen the bucket until the series fits in CHART_MAX_POINTS.
+    for coarser in ('day', 'week', 'month'):
+        if BUCKET_ORDER[coarser] < BUCKET_ORDER[bucket]:
+            continue
+        bucket = coarser
+        if bucket_count(start_date, today, bucket) <= CHART_MAX_POINTS:
+            break
+
+    labels, purchase_data, sale_data = movement_series(start_date, today, bucket)
+    data = {
+        'window': window,
+        'bucket': bucket,
+        'labels': labels,
         'purchases': purchase_data,
         'sales': sale_data
     }
+    cache.set(key, {'version': version, 'today': today, 'data': data})
+    return data
@@ -0,0 +1,203 @@
+import re
+
+from sqlalchemy import Float, case, cast, column, event, func, or_, table, text
+
+from app import app, db
+from models import Product
+import ngram
+
+
+# Name matches count for most, then SKU, then description.
+NAME_WEIGHT = 10.0
+SKU_WEIGHT = 5.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Words of a description search: SKUs such as "ABC-123" stay whole.
+_WORD = re.compile(r'[\w-]+')
+
+
+def search_words(search):
+    return _WORD.findall(search.lower())
+
+
+class SearchBackend:
+    """Product search without an index: substring match on name and SKU.
+
+    ``apply(query, search)`` returns the filtered query and a relevance
+    expression (higher is better), or None when results cannot be ranked.
+    ``description=False`` restricts matching to name and SKU.
+    Backends for specific databases override ``install`` to create their
+    index structures and ``apply`` to query them.
+    """
+
+    name = 'like'
+
+    def install(self, connection, online=False):
+        pass
+
+    def is_installed(self, connection):
+        return True
+
+    def apply(self, query, search, description=True):
+        return query.filter(or_(Product.name.icontains(search, autoescape=True),
+                                Product.sku.icontains(search, autoescape=True))), None
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 trigram index over name, SKU and description, ranked by bm25.
+
+    The trigram tokenizer matches any substring of three or more
+    characters, case-insensitively, so "idget" finds "Widget" and "003"
+    finds "W-003", as the unindexed search and the PostgreSQL backend do.
+    Shorter terms fall back to the unindexed search.  ``products_trgm`` is
+    an external-content table kept in step with ``products`` by triggers,
+    so bulk Core writes and upserts are indexed as well as ORM flushes.
+    """
+
+    name = 'fts5'
+    fts = table('products_trgm', column('rowid'), column('products_trgm'))
+    # The unicode61 word index this replaced; dropped by ``install``.
+    LEGACY = ('products_fts_insert', 'products_fts_delete', 'products_fts_update', 'products_fts')
+
+    DDL = (
+        """CREATE VIRTUAL TABLE IF NOT EXISTS products_trgm USING fts5(
+            name, sku, description, content='products', content_rowid='id',
+            tokenize='trigram')""",
+        """CREATE TRIGGER IF NOT EXISTS products_trgm_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_trgm(rowid, name, sku, description)
+            VALUES (new.id, new.name, new.sku, new.description);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS products_trgm_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_trgm(products_trgm, rowid, name, sku, description)
+            VALUES ('delete', old.id, old.name, old.sku, old.description);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS products_trgm_update AFTER UPDATE OF name, sku, description
+        ON products BEGIN
+            INSERT INTO products_trgm(products_trgm, rowid, name, sku, description)
+            VALUES ('delete', old.id, old.name, old.sku, old.description);
+            INSERT INTO products_trgm(rowid, name, sku, description)
+            VALUES (new.id, new.name, new.sku, new.description);
+        END""",
+    )
+
+    def install(self, connection, online=False):
+        for name in self.LEGACY[:-1]:
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {self.LEGACY[-1]}')
+        for statement in self.DDL:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("INSERT INTO products_trgm(products_trgm) VALUES ('rebuild')")
+
+    def is_installed(self, connection):
+        return connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'products_trgm'").first() is not None
+
+    def apply(self, query, search, description=True):
+        term = search.strip()
+        if len(term) < 3:
+            return super().apply(query, search)
+        # One phrase of the term's trigrams: a substring match of the whole
+        # term, like ILIKE '%term%'.
+        match = '"' + term.replace('"', '""') + '"'
+        match = f'{{name sku description}} : {match}' if description else f'{{name sku}} : {match}'
+        score = -func.bm25(self.fts.c.products_trgm, NAME_WEIGHT, SKU_WEIGHT, DESCRIPTION_WEIGHT,
+                           type_=Float)
+        matches = db.select(self.fts.c.rowid.label('id'), score.label('rank')).where(
+            self.fts.c.products_trgm.op('MATCH')(match)).subquery('search_matches')
+        return query.join(matches, Product.id == matches.c.id), matches.c.rank
+
+
+class PostgresSearchBackend(SearchBackend):
+    """pg_trgm GIN indexes on name and SKU plus a full-text index on the
+    description.
+
+    Name and SKU keep substring semantics (the trigram indexes serve
+    ``ILIKE '%x%'``); a SKU prefix match, name similarity and description
+    ``ts_rank`` make up the relevance score.
+    """
+
+    name = 'pg_trgm'
+    # Literal arguments, so the expression matches ix_products_description_fts.
+    description_vector = func.to_tsvector(text("'simple'"),
+                                          func.coalesce(Product.description, text("''")))
+
+    INDEXES = (
+        ('ix_products_name_trgm', 'gin (name gin_trgm_ops)'),
+        ('ix_products_sku_trgm', 'gin (sku gin_trgm_ops)'),
+        ('ix_products_description_fts', "gin (to_tsvector('simple', coalesce(description, '')))"),
+    )
+
+    def install(self, connection, online=False):
+        connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        concurrently = ' CONCURRENTLY' if online else ''
+        for name, definition in self.INDEXES:
+            connection.exec_driver_sql(
+                f'CREATE INDEX{concurrently} IF NOT EXISTS {name} ON products USING {definition}')
+
+    def is_installed(self, connection):
+        return connection.exec_driver_sql(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first() is not None
+
+    def apply(self, query, search, description=True):
+        words = search_words(search)
+        conditions = [Product.name.icontains(search, autoescape=True),
+                      Product.sku.icontains(search, autoescape=True)]
+        scores = [NAME_WEIGHT * func.similarity(Product.name, search),
+                  case((Product.sku.istartswith(search, autoescape=True), SKU_WEIGHT), else_=0.0)]
+        if words and description:
+            tsquery = func.to_tsquery(text("'simple'"), ' & '.join(f"'{word}':*" for word in words))
+            conditions.append(self.description_vector.op('@@')(tsquery))
+            scores.append(DESCRIPTION_WEIGHT * func.ts_rank(self.description_vector, tsquery))
+        # Cast to double precision so scores survive the round trip through
+        # a pagination cursor exactly.
+        rank = cast(sum(scores[1:], scores[0]), Float)
+        return query.filter(or_(*conditions)), rank
+
+
+class NgramSearchBackend(SearchBackend):
+    """Substring search on name and SKU answered from the worker's
+    in-memory trigram index (see ``ngram``); the database only fetches the
+    matching rows by primary key.  Results are not ranked."""
+
+    name = 'ngram'
+    # Beyond this many matches an IN list costs more than the LIKE scan.
+    MAX_IDS = 5000
+
+    def apply(self, query, search, description=True):
+        ids = ngram.index.search(search)
+        if len(ids) > self.MAX_IDS:
+            return super().apply(query, search)
+        return query.filter(Product.id.in_(ids)), None
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+_fallback = SearchBackend()
+_ngram = NgramSearchBackend()
+_installed = {}
+
+
+def backend_for(dialect_name):
+    return BACKENDS.get(dialect_name, _fallback)
+
+
+def search_backend(session):
+    """The search backend for the session's database, or the in-memory
+    n-gram index when ``SEARCH_BACKEND`` is 'ngram'.  Databases that have
+    not run ``flask --app main migrate`` yet get the unindexed search; this
+    is checked once per process."""
+    if app.config['SEARCH_BACKEND'] == 'ngram':
+        return _ngram
+    bind = session.get_bind()
+    backend = backend_for(bind.dialect.name)
+    if bind.url not in _installed:
+        _installed[bind.url] = backend.is_installed(session.connection())
+    return backend if _installed[bind.url] else _fallback
+
+
+@event.listens_for(Product.__table__, 'after_create')
+def _install_search(target, connection, **kw):
+    backend_for(connection.dialect.name).install(connection)
+    _installed.pop(connection.engine.url, None)
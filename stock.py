@@ -0,0 +1,137 @@
+from datetime import datetime
+
+from sqlalchemy import case, insert, select, update
+
+from models import Product, Transaction
+from versions import touch
+
+
+def adjust_stock(session, product_id, type_, quantity, notes=None, user_id=None):
+    """Apply one stock movement atomically and stage its ledger row.
+
+    The quantity is changed by a single conditional UPDATE, so concurrent
+    sales of the same product cannot lose updates or oversell without any
+    row lock being held across a read.  Returns the new Transaction, or
+    None if the product does not exist or a sale exceeds the stock on hand.
+    The caller commits.
+    """
+    delta = quantity if type_ == 'purchase' else -quantity
+    stmt = update(Product).where(Product.id == product_id)
+    if type_ != 'purchase':
+        stmt = stmt.where(Product.quantity >= quantity)
+    stmt = stmt.values(quantity=Product.quantity + delta).execution_options(
+        synchronize_session=False)
+
+    if session.execute(stmt).rowcount != 1:
+        return None
+    touch(session, 'products')
+
+    transaction = Transaction(
+        product_id=product_id,
+        type=type_,
+        quantity=quantity,
+        notes=notes,
+        user_id=user_id
+    )
+    session.add(transaction)
+    return transaction
+
+
+MAX_BATCH_LINES = 1000
+
+
+def _validate_line(line):
+    if not isinstance(line, dict):
+        return 'Each line must be an object'
+    sku = line.get('sku')
+    if not isinstance(sku, str) or not sku.strip():
+        return 'sku is required'
+    if line.get('type') not in ('purchase', 'sale'):
+        return "type must be 'purchase' or 'sale'"
+    quantity = line.get('quantity')
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+        return 'quantity must be a positive integer'
+    notes = line.get('notes')
+    if notes is not None and not isinstance(notes, str):
+        return 'notes must be a string'
+    return None
+
+
+def apply_stock_batch(session, lines, user_id=None):
+    """Apply many stock movements in one transaction.
+
+    Lines are checked in order against the stock on hand, then every
+    accepted line is applied with one UPDATE (a CASE over product ids) and
+    one multi-row ledger INSERT.  The UPDATE repeats the non-negative guard;
+    if a concurrent sale got there first it matches fewer rows, the session
+    is rolled back and the batch is replayed line by line with
+    ``adjust_stock`` instead.  Returns one result dict per line; the caller
+    commits.
+    """
+    results = [{'line': i, 'sku': line.get('sku') if isinstance(line, dict) else None}
+               for i, line in enumerate(lines)]
+    valid = []
+    for result, line in zip(results, lines):
+        error = _validate_line(line)
+        if error:
+            result.update(status='error', error=error)
+        else:
+            valid.append((result, line))
+
+    skus = {line['sku'].strip() for _, line in valid}
+    products = {sku: (id_, quantity) for id_, sku, quantity in session.execute(
+        select(Product.id, Product.sku, Product.quantity).where(Product.sku.in_(skus)))} if skus else {}
+
+    on_hand = {id_: quantity or 0 for id_, quantity in products.values()}
+    deltas = {}
+    accepted = []
+    for result, line in valid:
+        product = products.get(line['sku'].strip())
+        if product is None:
+            result.update(status='error', error='Unknown SKU')
+            continue
+        product_id = product[0]
+        delta = line['quantity'] if line['type'] == 'purchase' else -line['quantity']
+        if on_hand[product_id] + delta < 0:
+            result.update(status='error', error='Cannot sell more than available stock')
+            continue
+        on_hand[product_id] += delta
+        deltas[product_id] = deltas.get(product_id, 0) + delta
+        accepted.append((result, line, product_id))
+
+    if not accepted:
+        return results
+
+    new_quantity = Product.quantity + case(deltas, value=Product.id)
+    matched = session.execute(
+        update(Product)
+        .where(Product.id.in_(list(deltas)), new_quantity >= 0)
+        .values(quantity=new_quantity)
+        .execution_options(synchronize_session=False)).rowcount
+
+    if matched != len(deltas):
+        # Stock moved underneath us; fall back to per-line conditional updates.
+        session.rollback()
+        for result, line, product_id in accepted:
+            if adjust_stock(session, product_id, line['type'], line['quantity'],
+                            line.get('notes'), user_id) is None:
+                result.update(status='error', error='Cannot sell more than available stock')
+            else:
+                result.update(status='ok')
+        return results
+
+    now = datetime.utcnow()
+    ledger = [{
+        'product_id': product_id,
+        'type': line['type'],
+        'quantity': line['quantity'],
+        'notes': line.get('notes'),
+        'user_id': user_id,
+        'created_at': now,
+    } for _, line, product_id in accepted]
+    session.execute(insert(Transaction), ledger)
+    touch(session, 'products', 'transactions')
+
+    for result, _, _ in accepted:
+        result.update(status='ok')
+    return results
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+# The app reads its configuration at import time, so point it at an
+# in-memory database and a private cache directory before importing it.
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ['CACHE_DIR'] = tempfile.mkdtemp(prefix='inventory-test-cache-')
+os.environ['DASHBOARD_CACHE_TTL'] = '-1'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import main  # noqa: F401  (registers the routes)
+from app import app as flask_app
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    response = client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,104 @@
+"""The COPY importer against a real PostgreSQL database.
+
+Skipped unless TEST_POSTGRES_URL points at a database the tests may
+create tables in (the pg_trgm extension must be installable), e.g.
+
+    TEST_POSTGRES_URL=postgresql+psycopg2://postgres@localhost/inventory_test python -m pytest
+"""
+import io
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip('psycopg2')
+if not os.environ.get('TEST_POSTGRES_URL'):
+    pytest.skip('TEST_POSTGRES_URL is not set', allow_module_level=True)
+
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.orm import Session
+
+from app import db
+from importer import ProductImporter, PostgresProductImporter, make_product_importer, read_csv_upload
+from models import Product
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine(os.environ['TEST_POSTGRES_URL'])
+    db.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session(engine):
+    session = Session(engine)
+    prefix = f'T{uuid.uuid4().hex[:8]}'
+    session.info['prefix'] = prefix
+    yield session
+    session.rollback()
+    session.execute(delete(Product).where(Product.sku.startswith(prefix)))
+    session.commit()
+    session.close()
+
+
+def csv_bytes(prefix, rows):
+    lines = ['SKU,Name,Description,Selling Price,Quantity,Category']
+    lines += [f'{prefix}-{sku},{name},"{description}",{price},{quantity},{category}'
+              for sku, name, description, price, quantity, category in rows]
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+ROWS = [
+    ('1', 'Plain', 'simple', '1.50', '3', 'Tools'),
+    ('2', 'Tabbed', 'a\tb\\c', '2.00', '0', ''),
+    ('3', 'Multi line', 'first\nsecond', '', '', 'Tools'),
+    ('1', 'Repeat', 'same SKU again', '9.99', '1', ''),
+    ('4', 'Bad', 'x', 'not a price', '1', ''),
+    ('5', 'Last', '', '4', '7', 'Garden'),
+]
+
+
+def products(session, prefix):
+    return session.execute(
+        select(Product.sku, Product.name, Product.description, Product.selling_price,
+               Product.quantity)
+        .where(Product.sku.startswith(prefix)).order_by(Product.sku)).all()
+
+
+def run_import(session, importer_class, data, **kwargs):
+    importer = importer_class(session, chunk_size=2, **kwargs)
+    importer.feed_all(read_csv_upload(io.BytesIO(data)))
+    session.commit()
+    return importer
+
+
+def test_copy_import_matches_insert_import(session):
+    prefix = session.info['prefix']
+    copied = run_import(session, PostgresProductImporter, csv_bytes(f'{prefix}C', ROWS))
+    inserted = run_import(session, ProductImporter, csv_bytes(f'{prefix}I', ROWS))
+
+    assert (copied.imported, copied.skipped, copied.error_count) == \
+        (inserted.imported, inserted.skipped, inserted.error_count) == (4, 2, 2)
+    strip = lambda rows, p: [(sku[len(p):], *rest) for sku, *rest in rows]
+    assert strip(products(session, f'{prefix}C'), f'{prefix}C') == \
+        strip(products(session, f'{prefix}I'), f'{prefix}I')
+    assert products(session, f'{prefix}C')[1].description == 'a\tb\\c'
+
+
+def test_copy_upsert_updates_only_chosen_columns(session):
+    prefix = session.info['prefix']
+    run_import(session, PostgresProductImporter, csv_bytes(prefix, ROWS))
+    changed = [('1', 'Renamed', 'new', '5.00', '99', ''), ('6', 'New', '', '1', '2', '')]
+    importer = run_import(session, PostgresProductImporter, csv_bytes(prefix, changed),
+                          mode='upsert', update_columns=('selling_price',))
+
+    assert (importer.imported, importer.updated) == (1, 1)
+    first = products(session, prefix)[0]
+    assert (first.name, first.selling_price, first.quantity) == ('Plain', 5.0, 3)
+
+
+def test_copy_importer_is_opt_in(session):
+    assert type(make_product_importer(session)) is ProductImporter
+    assert type(make_product_importer(session, use_copy=True)) is PostgresProductImporter
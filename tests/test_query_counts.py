@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from models import User, Product, Category, Supplier, Transaction
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed(app, count):
+    """Add ``count`` products, each with its own category, supplier and two
+    transactions; every other product is low on stock."""
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        start = Product.query.count()
+        for i in range(start, start + count):
+            category = Category(name=f'Category {i}')
+            supplier = Supplier(name=f'Supplier {i}')
+            product = Product(name=f'Product {i}', sku=f'SKU-{i:05d}', quantity=5 if i % 2 else 50,
+                              reorder_level=10, category=category, supplier=supplier)
+            db.session.add_all([category, supplier, product])
+            db.session.flush()
+            for type_ in ('purchase', 'sale'):
+                db.session.add(Transaction(product_id=product.id, type=type_, quantity=1,
+                                           user_id=admin.id))
+        db.session.commit()
+
+
+def queries_for(app, client, url):
+    # The first request consumes any flashed message and warms the caches
+    # that depend on the data just seeded; the second is measured.
+    assert client.get(url).status_code == 200
+    with count_queries(app) as statements:
+        assert client.get(url).status_code == 200
+    return len(statements)
+
+
+ROUTES = ['/products', '/low-stock', '/transactions', '/dashboard']
+
+
+@pytest.mark.parametrize('url', ROUTES)
+def test_query_count_does_not_grow_with_rows(app, client, url):
+    seed(app, 5)
+    small = queries_for(app, client, url)
+    seed(app, 40)
+    large = queries_for(app, client, url)
+    assert large == small, f'{url} issued {large} queries with 45 products, {small} with 5'
+    assert small <= 6
@@ -0,0 +1,134 @@
+import uuid
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql.dml import Update
+
+from app import db
+from models import Product, Transaction
+from stock import adjust_stock, apply_stock_batch
+
+
+def make_product(app, quantity):
+    with app.app_context():
+        product = Product(name='Stock test', sku=f'ST-{uuid.uuid4().hex[:10]}', quantity=quantity)
+        db.session.add(product)
+        db.session.commit()
+        return product.id, product.sku
+
+
+def stock(product_id):
+    return db.session.get(Product, product_id, populate_existing=True).quantity
+
+
+def ledger(product_id):
+    return [(t.type, t.quantity) for t in
+            Transaction.query.filter_by(product_id=product_id).order_by(Transaction.id)]
+
+
+def test_adjust_stock_applies_sales_and_purchases(app):
+    product_id, _ = make_product(app, 5)
+    with app.app_context():
+        assert adjust_stock(db.session, product_id, 'sale', 3) is not None
+        assert adjust_stock(db.session, product_id, 'purchase', 4) is not None
+        db.session.commit()
+        assert stock(product_id) == 6
+        assert ledger(product_id) == [('sale', 3), ('purchase', 4)]
+
+
+def test_adjust_stock_refuses_oversell(app):
+    product_id, _ = make_product(app, 2)
+    with app.app_context():
+        assert adjust_stock(db.session, product_id, 'sale', 3) is None
+        db.session.commit()
+        assert stock(product_id) == 2
+        assert ledger(product_id) == []
+
+
+def test_adjust_stock_unknown_product(app):
+    with app.app_context():
+        assert adjust_stock(db.session, 999999, 'purchase', 1) is None
+
+
+def test_check_constraint_rejects_negative_stock(app):
+    product_id, _ = make_product(app, 1)
+    with app.app_context():
+        with pytest.raises(IntegrityError):
+            db.session.execute(update(Product).where(Product.id == product_id).values(quantity=-1))
+            db.session.flush()
+        db.session.rollback()
+        assert stock(product_id) == 1
+
+
+def test_batch_reports_each_line(app):
+    product_id, sku = make_product(app, 5)
+    lines = [
+        {'sku': sku, 'type': 'sale', 'quantity': 4},
+        {'sku': sku, 'type': 'sale', 'quantity': 2},
+        {'sku': sku, 'type': 'purchase', 'quantity': 10, 'notes': 'restock'},
+        {'sku': 'NO-SUCH-SKU', 'type': 'sale', 'quantity': 1},
+        {'sku': sku, 'type': 'refund', 'quantity': 1},
+        {'sku': sku, 'type': 'sale', 'quantity': 0},
+        'not an object',
+    ]
+    with app.app_context():
+        results = apply_stock_batch(db.session, lines)
+        db.session.commit()
+
+        assert [r['status'] for r in results] == ['ok', 'error', 'ok', 'error', 'error', 'error', 'error']
+        assert [r.get('error') for r in results] == [
+            None,
+            'Cannot sell more than available stock',
+            None,
+            'Unknown SKU',
+            "type must be 'purchase' or 'sale'",
+            'quantity must be a positive integer',
+            'Each line must be an object',
+        ]
+        assert [r['line'] for r in results] == list(range(len(lines)))
+        assert stock(product_id) == 11
+        assert ledger(product_id) == [('sale', 4), ('purchase', 10)]
+
+
+class RacingSession:
+    """A session whose first UPDATE is preceded by a committed sale from
+    "another request", after the batch has read the stock on hand."""
+
+    def __init__(self, session, product_id, quantity):
+        self._session = session
+        self._race = (product_id, quantity)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    def execute(self, statement, *args, **kwargs):
+        if self._race and isinstance(statement, Update):
+            product_id, quantity = self._race
+            self._race = None
+            self._session.execute(update(Product).where(Product.id == product_id)
+                                  .values(quantity=Product.quantity - quantity))
+            self._session.commit()
+        return self._session.execute(statement, *args, **kwargs)
+
+
+def test_batch_falls_back_to_single_lines_when_stock_moves(app):
+    product_id, sku = make_product(app, 5)
+    other_id, other_sku = make_product(app, 5)
+    lines = [
+        {'sku': sku, 'type': 'sale', 'quantity': 3},
+        {'sku': sku, 'type': 'sale', 'quantity': 2},
+        {'sku': other_sku, 'type': 'sale', 'quantity': 1},
+    ]
+    with app.app_context():
+        # Two units go elsewhere after the batch saw five on hand, so only
+        # the first sale still fits.
+        results = apply_stock_batch(RacingSession(db.session, product_id, 2), lines)
+        db.session.commit()
+
+        assert [r['status'] for r in results] == ['ok', 'error', 'ok']
+        assert results[1]['error'] == 'Cannot sell more than available stock'
+        assert stock(product_id) == 0
+        assert stock(other_id) == 4
+        assert ledger(product_id) == [('sale', 3)]
+        assert ledger(other_id) == [('sale', 1)]
@@ -0,0 +1,49 @@
+from sqlalchemy import event
+
+from app import db, cache
+
+
+_PENDING = 'pending_version_bumps'
+
+
+def touch(session, *names):
+    """Mark tables as changed; their version stamps are bumped once the
+    session commits, so other workers never see a stamp for uncommitted data."""
+    session.info.setdefault(_PENDING, set()).update(names)
+
+
+def current(*names):
+    """The tables' version stamps.  A table without one is bumped first:
+    after the cache directory is wiped, reporting the "missing" stamp would
+    repeat ETags handed out before and answer 304 for changed data."""
+    stamps = []
+    for name in names:
+        stamp = cache.version(name)
+        if stamp == '0':
+            stamp = cache.bump(name)
+        stamps.append(stamp)
+    return tuple(stamps)
+
+
+def last_modified(*names):
+    """When any of the stamps last changed, or None if none has a stamp."""
+    times = [t for t in map(cache.version_time, names) if t is not None]
+    return max(times) if times else None
+
+
+@event.listens_for(db.session, 'after_flush')
+def _touch_flushed(session, flush_context):
+    # ORM writes mark their own tables; Core writes call touch() themselves.
+    for obj in session.new | session.dirty | session.deleted:
+        touch(session, obj.__table__.name)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _bump_versions(session):
+    for name in session.info.pop(_PENDING, ()):
+        cache.bump(name)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_versions(session):
+    session.info.pop(_PENDING, None)